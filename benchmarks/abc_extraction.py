@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Micro-benchmark of ABC header extraction from thesession.org tune pages.
+
+Compares the full-page text scan (BeautifulSoup ``get_text``) with the
+targeted ``parse_abc_header`` on a directory of saved tune pages:
+
+    python benchmarks/abc_extraction.py saved_pages/
+
+Without a directory, synthetic pages shaped like tune pages are used.
+Reports per-page parse time and peak memory for both methods.
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from irish_anki import parse_abc_header, _abc_from_page_text, _abc_fields
+
+
+def full_text_scan(page):
+    header = _abc_from_page_text(page)
+    return _abc_fields(header) if header else None
+
+
+METHODS = [('full text scan', full_text_scan), ('targeted', parse_abc_header)]
+
+
+def synthetic_pages(count, seed=0):
+    """Pages with a navigation bar, several ABC settings and a long comment thread"""
+    rng = random.Random(seed)
+    pages = []
+    for i in range(count):
+        rhythm = rng.choice(['reel', 'jig', 'hornpipe', 'polka', 'slide'])
+        key = rng.choice(['Dmaj', 'Gmaj', 'Ador', 'Emin', 'Bmin'])
+        nav = ''.join(f'<li><a href="/tunes/{n}">Tune {n}</a></li>' for n in range(60))
+        # Tune pages break ABC lines with "<br />" followed by a newline
+        settings = ''.join(
+            f'<div class="setting"><div class="notes">\nX: {n}<br />\nT: Tune {i}<br />\nR: {rhythm}<br />\n'
+            f'M: 4/4<br />\nL: 1/8<br />\nK: {key}<br />\n'
+            + '|:' + ' '.join(rng.choice(['ABcd', 'efge', 'dBAG', 'FAdA']) for beat in range(64)) + ':|'
+            + '\n</div></div>'
+            for n in range(1, rng.randint(2, 8)))
+        comments = ''.join(
+            f'<div class="comment"><p>Lovely tune, learned it from a session in {rng.randint(1960, 2024)}. '
+            + 'Great in a set with the next one. ' * rng.randint(1, 20) + '</p></div>'
+            for n in range(rng.randint(5, 80)))
+        pages.append(f'<html><head><title>Tune {i}</title></head><body><ul class="nav">{nav}</ul>'
+                     f'<h1>Tune {i}</h1>{settings}{comments}</body></html>')
+    return pages
+
+
+def load_pages(directory):
+    return [path.read_text(encoding='utf-8', errors='replace') for path in sorted(Path(directory).glob('*.htm*'))]
+
+
+def measure(extract, pages, repeat):
+    """Return per-page best-of-``repeat`` times (s), peak allocations (bytes) and results"""
+    times, peaks, results = [], [], []
+    for page in pages:
+        best = float('inf')
+        for attempt in range(repeat):
+            start = time.perf_counter()
+            extract(page)
+            best = min(best, time.perf_counter() - start)
+        tracemalloc.start()
+        results.append(extract(page))
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        times.append(best)
+    return times, peaks, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ABC header extraction from tune pages')
+    parser.add_argument('pages_dir', nargs='?', help='Directory of saved thesession.org tune pages (*.html)')
+    parser.add_argument('--synthetic', type=int, default=50, help='Synthetic pages to use without a directory (default: 50)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing runs per page, best one kept (default: 5)')
+    args = parser.parse_args()
+    
+    pages = load_pages(args.pages_dir) if args.pages_dir else synthetic_pages(args.synthetic)
+    if not pages:
+        print(f"No .html pages found in {args.pages_dir}")
+        return
+    print(f"{len(pages)} pages, {sum(map(len, pages)) / len(pages) / 1024:.0f} KiB on average\n")
+    
+    print(f"{'method':<16}{'median ms':>12}{'p95 ms':>10}{'peak KiB':>12}")
+    all_results = []
+    for name, extract in METHODS:
+        times, peaks, results = measure(extract, pages, args.repeat)
+        times.sort()
+        print(f"{name:<16}{statistics.median(times) * 1000:>12.3f}{times[int(len(times) * 0.95)] * 1000:>10.3f}"
+              f"{statistics.mean(peaks) / 1024:>12.1f}")
+        all_results.append(results)
+    
+    mismatches = sum(1 for results in zip(*all_results) if len(set(results)) > 1)
+    print(f"\nPages where the methods disagree: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Benchmark of .apkg writing: genanki's ``Package.write_to_file`` against
+``write_apkg``.
+
+Builds a deck of notes with synthetic MP3-sized media and writes it with
+both methods, each in a fresh process so peak memory is not shared:
+
+    python benchmarks/apkg_writer.py --notes 500 --media-kib 800
+
+Reports wall time, peak RSS, output size and leftover temporary files.
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import genanki
+
+from irish_anki import write_apkg, stable_id
+
+METHODS = ['genanki', 'write_apkg']
+
+
+def make_media(directory, notes, media_kib):
+    """Random bytes stand in for MP3s: both are already compressed"""
+    paths = []
+    for i in range(notes):
+        path = Path(directory) / f"tune_{i:05d}.mp3"
+        path.write_bytes(os.urandom(media_kib * 1024))
+        paths.append(str(path))
+    return paths
+
+
+def build_package(media):
+    model = genanki.Model(stable_id('benchmark model'), 'Benchmark',
+                          fields=[{'name': 'Audio'}, {'name': 'Title'}],
+                          templates=[{'name': 'Card', 'qfmt': '{{Audio}}', 'afmt': '{{Title}}'}])
+    deck = genanki.Deck(stable_id('benchmark deck'), 'Benchmark')
+    for path in media:
+        name = os.path.basename(path)
+        deck.add_note(genanki.Note(model=model, fields=[f"[sound:{name}]", name]))
+    package = genanki.Package(deck)
+    package.media_files = media
+    return package
+
+
+def run_method(method, media_dir, output):
+    """Write the package once and print ``seconds peak_kib``"""
+    media = sorted(str(path) for path in Path(media_dir).glob('*.mp3'))
+    package = build_package(media)
+    start = time.perf_counter()
+    if method == 'genanki':
+        package.write_to_file(output)
+    else:
+        write_apkg(package, output)
+    elapsed = time.perf_counter() - start
+    print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def temp_files():
+    return set(Path(tempfile.gettempdir()).iterdir())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark .apkg writing methods')
+    parser.add_argument('--notes', type=int, default=200, help='Notes with one media file each (default: 200)')
+    parser.add_argument('--media-kib', type=int, default=500, help='Size of each media file in KiB (default: 500)')
+    parser.add_argument('--method', choices=METHODS, help=argparse.SUPPRESS)
+    parser.add_argument('--media-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.method:
+        run_method(args.method, args.media_dir, args.output)
+        return
+
+    with tempfile.TemporaryDirectory() as work:
+        media_dir = Path(work) / 'media'
+        media_dir.mkdir()
+        make_media(media_dir, args.notes, args.media_kib)
+        print(f"{args.notes} notes, {args.notes * args.media_kib / 1024:.0f} MiB of media\n")
+
+        print(f"{'method':<12}{'seconds':>10}{'peak RSS MiB':>14}{'size MiB':>10}{'temp files':>12}")
+        for method in METHODS:
+            output = Path(work) / f"{method}.apkg"
+            before = temp_files()
+            result = subprocess.run([sys.executable, __file__, '--method', method,
+                                     '--media-dir', str(media_dir), '--output', str(output)],
+                                    capture_output=True, text=True, check=True)
+            leftover = temp_files() - before
+            for path in leftover:
+                if path.is_file():
+                    path.unlink()
+            elapsed, peak_kib = result.stdout.split()
+            print(f"{method:<12}{float(elapsed):>10.2f}{int(peak_kib) / 1024:>14.1f}"
+                  f"{output.stat().st_size / 1024 ** 2:>10.1f}{len(leftover):>12}")
+
+
+if __name__ == '__main__':
+    main()
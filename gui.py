@@ -4,12 +4,11 @@ import tkinter as tk
 from tkinter import ttk, filedialog, scrolledtext
 import threading
 import sys
-import shutil
 import os
 from pathlib import Path
 from io import StringIO
 
-from irish_anki import convert_to_mp3, organize_music_files, generate_anki_cards
+from irish_anki import convert_to_mp3, convert_into_export, organize_music_files, generate_anki_cards, default_jobs, DEFAULT_EXCERPT
 from locale_manager import _, get_available_languages, set_language, get_current_language
 
 
@@ -210,6 +209,9 @@ class IrishAnkiGUI:
         self.output_file = tk.StringVar(value="irish_music.apkg")
         self.deck_name = tk.StringVar(value="Irish Traditional Music")
         self.randomize_cards = tk.BooleanVar(value=True)
+        self.jobs = tk.IntVar(value=default_jobs())
+        self.excerpt_enabled = tk.BooleanVar(value=False)
+        self.excerpt_duration = tk.DoubleVar(value=DEFAULT_EXCERPT['duration'])
         self.current_language = tk.StringVar(value=get_current_language())
         
         # Card layout customization variables
@@ -242,6 +244,9 @@ class IrishAnkiGUI:
             'output_file': self.output_file.get(),
             'deck_name': self.deck_name.get(),
             'randomize_cards': self.randomize_cards.get(),
+            'jobs': self.get_jobs(),
+            'excerpt_enabled': self.excerpt_enabled.get(),
+            'excerpt_duration': self.get_excerpt_duration(),
             'front_name': self.front_name.get(),
             'front_audio': self.front_audio.get(),
             'front_key': self.front_key.get(),
@@ -273,6 +278,9 @@ class IrishAnkiGUI:
         self.output_file.set(current_values['output_file'])
         self.deck_name.set(current_values['deck_name'])
         self.randomize_cards.set(current_values['randomize_cards'])
+        self.jobs.set(current_values['jobs'])
+        self.excerpt_enabled.set(current_values['excerpt_enabled'])
+        self.excerpt_duration.set(current_values['excerpt_duration'])
         self.front_name.set(current_values['front_name'])
         self.front_audio.set(current_values['front_audio'])
         self.front_key.set(current_values['front_key'])
@@ -444,6 +452,17 @@ class IrishAnkiGUI:
         ttk.Checkbutton(options_frame, text=_("gui.checkbox.randomize_cards"), 
                        variable=self.randomize_cards).grid(row=1, column=0, columnspan=2, sticky="w", pady=5)
         
+        # Parallel conversion jobs
+        ttk.Label(options_frame, text=_("gui.label.jobs")).grid(row=2, column=0, sticky="w", pady=2)
+        ttk.Spinbox(options_frame, from_=1, to=max(64, default_jobs()), textvariable=self.jobs,
+                    width=5).grid(row=2, column=1, sticky="w", padx=(10, 0))
+        
+        # Excerpt mode: cut short study clips instead of whole recordings
+        ttk.Checkbutton(options_frame, text=_("gui.checkbox.excerpt"),
+                       variable=self.excerpt_enabled).grid(row=3, column=0, sticky="w", pady=2)
+        ttk.Spinbox(options_frame, from_=5, to=600, increment=5, textvariable=self.excerpt_duration,
+                    width=5).grid(row=3, column=1, sticky="w", padx=(10, 0))
+        
     def create_card_layout_section(self, parent, row):
         """Create the card layout customization section"""
         layout_frame = ttk.LabelFrame(parent, text=_("gui.section.card_layout"), padding="10")
@@ -637,6 +656,24 @@ class IrishAnkiGUI:
                     
         return True
         
+    def get_jobs(self):
+        try:
+            return max(1, self.jobs.get())
+        except tk.TclError:
+            return default_jobs()
+        
+    def get_excerpt_duration(self):
+        try:
+            duration = self.excerpt_duration.get()
+        except tk.TclError:
+            return DEFAULT_EXCERPT['duration']
+        return duration if duration > 0 else DEFAULT_EXCERPT['duration']
+        
+    def get_excerpt(self):
+        if not self.excerpt_enabled.get():
+            return None
+        return {'duration': self.get_excerpt_duration()}
+        
     def disable_buttons(self):
         self.convert_btn.config(state="disabled")
         self.organize_btn.config(state="disabled")
@@ -666,7 +703,7 @@ class IrishAnkiGUI:
                     self.set_status("Validation failed")
                     return
                 
-                success = convert_to_mp3(input_dir, mp3_dir)
+                success = convert_to_mp3(input_dir, mp3_dir, self.get_jobs(), excerpt=self.get_excerpt())
                 
                 if success:
                     self.set_status("Processing completed!")
@@ -791,7 +828,6 @@ class IrishAnkiGUI:
                 self.capture_console_output()
                 
                 input_dir = self.input_dir.get()
-                mp3_dir = self.mp3_dir.get()
                 export_dir = self.export_dir.get()
                 output_file = self.output_file.get()
                 deck_name = self.deck_name.get()
@@ -813,37 +849,24 @@ class IrishAnkiGUI:
                     }
                 }
                 
-                self.log_message("🚀 FULL WORKFLOW: Audio → MP3 → Organized → Anki Deck\n")
+                self.log_message("🚀 FULL WORKFLOW: Audio → Organized MP3 → Anki Deck\n")
                 self.log_message("=" * 60 + "\n")
                 
-                if not self.validate_and_create_directories(input_dir, mp3_dir, export_dir):
+                # Tunes are looked up first and converted straight into the
+                # export folder, so no intermediate MP3 folder is needed
+                if not self.validate_and_create_directories(input_dir, "dummy", export_dir):
                     self.set_status("Validation failed")
                     return
                 
-                self.log_message("🎵 Step 1: Processing audio files...\n")
-                self.set_status("Step 1: Processing audio files...")
-                if not convert_to_mp3(input_dir, mp3_dir):
+                self.log_message("🎵 Step 1: Looking up tunes and processing audio files...\n")
+                self.set_status("Step 1: Looking up tunes and processing audio files...")
+                if not convert_into_export(input_dir, export_dir, self.get_jobs(), excerpt=self.get_excerpt()):
                     self.set_status("Processing failed")
                     self.log_message("❌ Audio processing failed, stopping process\n")
                     return
                 
-                self.log_message("\n🗂️  Step 2: Organizing music files...\n")
-                self.set_status("Step 2: Organizing music files...")
-                if not organize_music_files(mp3_dir, export_dir):
-                    self.set_status("Organization failed")
-                    self.log_message("❌ Organization failed, stopping process\n")
-                    return
-                
-                # Clean up MP3 directory after successful organization
-                try:
-                    if Path(mp3_dir).exists():
-                        shutil.rmtree(mp3_dir)
-                        self.log_message(f"🗑️  Cleaned up temporary MP3 directory: {mp3_dir}\n")
-                except Exception as e:
-                    self.log_message(f"⚠️  Could not remove MP3 directory: {e}\n")
-                
-                self.log_message("\n🎴 Step 3: Generating Anki .apkg file...\n")
-                self.set_status("Step 3: Generating Anki cards...")
+                self.log_message("\n🎴 Step 2: Generating Anki .apkg file...\n")
+                self.set_status("Step 2: Generating Anki cards...")
                 if generate_anki_cards(export_dir, output_file, deck_name, randomize, card_layout):
                     self.set_status("All steps completed!")
                     self.log_message("\n🎉 All steps completed successfully!\n")
@@ -1,242 +1,1794 @@
 #!/usr/bin/env python3
 
+import os
+import sys
+import csv
+import errno
+import json
+import html
+import hashlib
+import filecmp
+import mmap
+import threading
+import sqlite3
 import random
 import time
 import re
+import unicodedata
+import heapq
 import shutil
 import argparse
 import subprocess
+import itertools
+import tempfile
+import zipfile
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from pathlib import Path
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from urllib.parse import quote_plus
 from typing import List, Tuple
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import genanki
 from locale_manager import _
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
-def respectful_delay():
-    time.sleep(2)  # 2 seconds between requests to be respectful
 
+LINK_MODES = ['copy', 'hardlink', 'reflink', 'symlink', 'move']
 
-def convert_to_mp3(input_dir, output_dir="mp3_files"):
-    """Convert various audio formats to mp3 using ffmpeg, or copy existing MP3s if needed"""
+# Order in which placement methods are tried when the filesystem can't do
+# the requested one (e.g. hardlinks across devices, reflinks on ext4)
+LINK_FALLBACKS = {
+    'copy': ['copy'],
+    'hardlink': ['hardlink', 'reflink', 'copy'],
+    'reflink': ['reflink', 'copy'],
+    'symlink': ['symlink', 'hardlink', 'copy'],
+    'move': ['move'],
+}
+
+FICLONE = 0x40049409  # Linux ioctl to share extents between files
+
+
+def _reflink(src, dst):
+    """Clone src into dst with a copy-on-write reflink (btrfs, XFS, ...)"""
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, "reflinks are not supported on this platform")
+    try:
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    except OSError:
+        Path(dst).unlink(missing_ok=True)
+        raise
+    shutil.copystat(src, dst)
+
+
+def _move(src, dst):
+    """Rename src to dst, copying then deleting when they are on different devices.
+    
+    Raises FileExistsError rather than replace a dst whose content differs
+    from src, since the move leaves no other copy of it.
+    """
+    if dst.exists() and not filecmp.cmp(src, dst, shallow=False):
+        raise FileExistsError(errno.EEXIST, "A different file is already there", str(dst))
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        tmp = dst.with_name(f".{dst.name}.tmp")
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+        os.remove(src)
+
+
+def place_file(src, dst, link_mode='copy'):
+    """Place src at dst using link_mode, falling back per LINK_FALLBACKS.
+    
+    Existing destinations are replaced atomically rather than written
+    through, so a hardlinked output never modifies its source. Moves never
+    replace a different file (see ``_move``).
+    Returns the mode that was actually used.
+    """
+    src, dst = Path(src), Path(dst)
+    last_error = None
+    for mode in LINK_FALLBACKS[link_mode]:
+        if mode == 'move':
+            _move(src, dst)
+            return mode
+        
+        tmp = dst.with_name(f".{dst.name}.tmp")
+        tmp.unlink(missing_ok=True)
+        try:
+            if mode == 'hardlink':
+                os.link(src, tmp)
+            elif mode == 'reflink':
+                _reflink(src, tmp)
+            elif mode == 'symlink':
+                os.symlink(src.resolve(), tmp)
+            else:
+                shutil.copy2(src, tmp)
+            os.replace(tmp, dst)
+            return mode
+        except OSError as e:
+            tmp.unlink(missing_ok=True)
+            last_error = e
+    raise last_error
+
+
+# Supported audio formats for conversion (excluding MP3)
+AUDIO_EXTENSIONS = ['.m4a', '.wav', '.flac', '.aac', '.ogg', '.mp4', '.webm']
+
+
+def walk_audio_files(root, extensions=('.mp3', *AUDIO_EXTENSIONS), max_depth=None, exclude=()):
+    """Lazily yield (path, extension) for audio files under root.
+    
+    The tree is walked once with os.scandir, classifying entries by their
+    lowercased extension. Hidden entries and directories in ``exclude`` are
+    skipped; ``max_depth=0`` limits the walk to root itself.
+    """
+    extensions = {ext.lower() for ext in extensions}
+    excluded = {Path(d).resolve() for d in exclude}
+    stack = [(Path(root), 0)]
+    
+    while stack:
+        directory, depth = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            print(f"Warning: Could not read directory {directory}: {e}")
+            continue
+        
+        subdirs = []
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if max_depth is None or depth < max_depth:
+                        subdirs.append(Path(entry.path))
+                elif entry.is_file():
+                    ext = os.path.splitext(entry.name)[1].lower()
+                    if ext in extensions:
+                        yield Path(entry.path), ext
+            except OSError:
+                continue
+        
+        for subdir in reversed(subdirs):
+            if subdir.resolve() not in excluded:
+                stack.append((subdir, depth + 1))
+
+
+def default_jobs():
+    """Default number of parallel conversion jobs"""
+    return os.cpu_count() or 1
+
+
+class ResourceBudget:
+    """CPU, IO and time limits applied to every ffmpeg/ffprobe subprocess.
+    
+    ``threads`` caps ffmpeg's own threads, ``nice`` and ``ionice`` ('idle' or
+    'best-effort') lower the scheduling priority, ``timeout`` kills a
+    process after that many seconds per file, and ``max_concurrency`` caps
+    how many subprocesses run at once across all worker pools.
+    """
+    
+    def __init__(self, threads=None, nice=None, ionice=None, timeout=None, max_concurrency=None):
+        self.threads = threads
+        self.nice = nice
+        self.ionice = ionice
+        self.timeout = timeout
+        self.killed = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        
+        self._prefix = []
+        self._creationflags = 0
+        if nice:
+            if os.name == 'nt':
+                self._creationflags = (subprocess.IDLE_PRIORITY_CLASS if nice >= 10
+                                       else subprocess.BELOW_NORMAL_PRIORITY_CLASS)
+            elif shutil.which('nice'):
+                self._prefix += ['nice', '-n', str(nice)]
+        if ionice and sys.platform.startswith('linux') and shutil.which('ionice'):
+            self._prefix += ['ionice', '-c', '3'] if ionice == 'idle' else ['ionice', '-c', '2', '-n', '7']
+    
+    def ffmpeg_args(self):
+        """Output options limiting ffmpeg's own threading"""
+        return ['-threads', str(self.threads)] if self.threads else []
+    
+    def run(self, command, label=None, files=1):
+        """Run a command within the budget and return the CompletedProcess.
+        
+        The timeout scales with the number of ``files`` handled. On timeout
+        the process is killed, ``label`` (if any) is recorded in ``killed``
+        and subprocess.TimeoutExpired is raised.
+        """
+        timeout = self.timeout * files if self.timeout else None
+        if self._slots:
+            self._slots.acquire()
+        try:
+            return subprocess.run(self._prefix + command, capture_output=True, text=True,
+                                  timeout=timeout, creationflags=self._creationflags)
+        except subprocess.TimeoutExpired:
+            if label is not None:
+                with self._lock:
+                    self.killed.append(label)
+            raise
+        finally:
+            if self._slots:
+                self._slots.release()
+
+
+# Encoder settings recorded in the manifest; changing them re-encodes everything
+MP3_ENCODER_SETTINGS = {'codec': 'libmp3lame', 'bitrate': '192k', 'stream_copy': True}
+MP3_COPY_SETTINGS = {'mode': 'copy'}
+MP3_MOVE_SETTINGS = {'mode': 'move'}
+
+# Study clip cut from each recording in excerpt mode (all values in seconds)
+DEFAULT_EXCERPT = {'start': 0.0, 'duration': 30.0, 'fade_in': 0.5, 'fade_out': 2.0}
+
+MANIFEST_NAME = ".irish_anki_manifest.json"
+MANIFEST_VERSION = 1
+
+
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """Stream a file through SHA-256 and return the hex digest.
+    
+    Large files are mapped into memory instead of read into buffers.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                with memoryview(mapped) as view:
+                    for offset in range(0, size, chunk_size):
+                        digest.update(view[offset:offset + chunk_size])
+        else:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path):
+    """Return the size, mtime and content hash of a file"""
+    stat = Path(path).stat()
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': file_hash(path)}
+
+
+DEDUPE_MODES = ['off', 'bytes', 'audio']
+
+
+def audio_checksum(audio_file, budget=None):
+    """Checksum of the decoded audio, downmixed to 8 kHz mono to keep it cheap"""
+    budget = budget or ResourceBudget()
+    try:
+        result = budget.run([
+            'ffmpeg', '-v', 'error', '-i', str(audio_file),
+            '-map', '0:a:0', '-ac', '1', '-ar', '8000',
+            *budget.ffmpeg_args(), '-f', 'md5', '-'
+        ], label=Path(audio_file).name)
+    except subprocess.TimeoutExpired:
+        return None
+    if result.returncode != 0 or not result.stdout.startswith('MD5='):
+        return None
+    return result.stdout.strip()[4:]
+
+
+def find_duplicate_groups(files, audio=False, jobs=1, budget=None):
+    """Group identical recordings, returning lists with the canonical file first.
+    
+    Files are bucketed by size and only same-size files are hashed, so
+    unique files are never read. With ``audio=True`` the remaining groups
+    are also merged when their decoded audio checksums match (e.g. the same
+    stream in different containers).
+    """
+    by_size = {}
+    for f in files:
+        by_size.setdefault(f.stat().st_size, []).append(f)
+    candidates = [f for same_size in by_size.values() if len(same_size) > 1 for f in same_size]
+    
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        hashes = dict(zip(candidates, executor.map(file_hash, candidates)))
+        
+        groups = {}
+        for f in files:
+            groups.setdefault(hashes.get(f, f), []).append(f)
+        groups = list(groups.values())
+        
+        if audio and len(groups) > 1 and shutil.which('ffmpeg'):
+            checksums = list(executor.map(lambda f: audio_checksum(f, budget), [group[0] for group in groups]))
+            merged = {}
+            for group, checksum in zip(groups, checksums):
+                merged.setdefault(checksum or id(group), []).extend(group)
+            groups = list(merged.values())
+    
+    order = {f: i for i, f in enumerate(files)}
+    return sorted((sorted(group, key=order.get) for group in groups), key=lambda group: order[group[0]])
+
+
+def load_manifest(output_path):
+    """Load the conversion manifest from an output directory"""
+    manifest_file = Path(output_path) / MANIFEST_NAME
+    if manifest_file.exists():
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == MANIFEST_VERSION:
+                return manifest
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Warning: Could not read manifest {manifest_file}: {e}")
+    return {'version': MANIFEST_VERSION, 'entries': {}}
+
+
+def save_manifest(output_path, manifest):
+    """Atomically write the conversion manifest to an output directory"""
+    manifest_file = Path(output_path) / MANIFEST_NAME
+    tmp_file = manifest_file.with_name(manifest_file.name + '.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_file, manifest_file)
+
+
+def plan_output_names(source_files, input_path):
+    """Map each source file to a unique mp3 filename in the output directory.
+    
+    Files keep their stem unless several sources share it (e.g. in different
+    subfolders), in which case they are numbered in relative-path order,
+    skipping numbers whose name another source already has (compared
+    case-insensitively).
+    """
+    by_stem = {}
+    for source in sorted(source_files, key=lambda f: f.relative_to(input_path).as_posix()):
+        by_stem.setdefault(source.stem.lower(), []).append(source)
+    
+    # The first source of each stem keeps its name, so real names win over numbered ones
+    names = {sources[0]: f"{sources[0].stem}.mp3" for sources in by_stem.values()}
+    taken = {name.lower() for name in names.values()}
+    for sources in by_stem.values():
+        number = 1
+        for source in sources[1:]:
+            while True:
+                number += 1
+                name = f"{source.stem} ({number}).mp3"
+                if name.lower() not in taken:
+                    break
+            taken.add(name.lower())
+            names[source] = name
+    return names
+
+
+def is_up_to_date(entry, source_file, output_file, settings, output_name=None):
+    """Check a manifest entry against the current source, output and settings.
+    
+    ``output_name`` is the output's path relative to the output directory
+    (default: its file name).
+    """
+    if not entry or entry.get('output') != (output_name or output_file.name) or entry.get('settings') != settings:
+        return False
+    if not output_file.exists():
+        return False
+    
+    stat = source_file.stat()
+    if entry.get('size') != stat.st_size:
+        return False
+    if entry.get('mtime') == stat.st_mtime_ns:
+        return True
+    
+    # Same size but touched: only the content decides
+    if entry.get('hash') == file_hash(source_file):
+        entry['mtime'] = stat.st_mtime_ns
+        return True
+    return False
+
+
+def remove_orphaned_outputs(output_path, entries, source_keys, output_names):
+    """Delete outputs whose source is gone or now maps to a different file"""
+    planned = set(output_names.values())
+    removed = 0
+    for key, entry in list(entries.items()):
+        if key in source_keys and source_keys[key] == entry.get('output'):
+            continue
+        del entries[key]
+        
+        # Moved sources are gone on purpose, their output is all that's left
+        if key not in source_keys and entry.get('settings') == MP3_MOVE_SETTINGS:
+            continue
+        
+        old_output = output_path / entry.get('output', '')
+        if entry.get('output') and entry['output'] not in planned and old_output.is_file():
+            try:
+                old_output.unlink()
+                print(f"  Removed orphaned output: {old_output.name}")
+                removed += 1
+            except OSError as e:
+                print(f"  ✗ Could not remove {old_output.name}: {e}")
+    return removed
+
+
+def probe_audio_stream(audio_file, budget=None):
+    """Return the codec of a file's first audio stream and its duration using ffprobe"""
+    budget = budget or ResourceBudget()
+    result = budget.run([
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'a:0',
+        '-show_entries', 'stream=codec_name:format=duration',
+        '-of', 'json', str(audio_file)
+    ], label=Path(audio_file).name)
+    if result.returncode != 0:
+        return None
+    
+    info = json.loads(result.stdout or '{}')
+    streams = info.get('streams') or [{}]
+    duration = info.get('format', {}).get('duration')
+    return {
+        'codec': streams[0].get('codec_name'),
+        'duration': float(duration) if duration not in (None, 'N/A') else None,
+    }
+
+
+def probe_audio_files(audio_files, jobs, budget=None):
+    """Probe many files at once, fanning ffprobe calls out over the worker pool.
+    
+    Returns a path -> probe dict mapping; files that could not be probed
+    (or all files, if ffprobe is missing) map to None.
+    """
+    if not audio_files or shutil.which('ffprobe') is None:
+        return {audio_file: None for audio_file in audio_files}
+    
+    def safe_probe(audio_file):
+        try:
+            return probe_audio_stream(audio_file, budget)
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            return None
+    
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return dict(zip(audio_files, executor.map(safe_probe, audio_files)))
+
+
+def conversion_settings(excerpt=None):
+    """Settings profile for a conversion run, as recorded in the manifest"""
+    settings = dict(MP3_ENCODER_SETTINGS)
+    if excerpt:
+        settings['excerpt'] = {**DEFAULT_EXCERPT, **excerpt}
+    return settings
+
+
+def choose_encoding(probe, settings=MP3_ENCODER_SETTINGS):
+    """Decide how to produce an mp3 from a probed source.
+    
+    MP3 audio inside another container is remuxed with ``-c:a copy``;
+    everything else is encoded with the configured settings. In excerpt
+    mode the clip is fitted to the recording's length, and fades force a
+    re-encode.
+    """
+    excerpt = settings.get('excerpt')
+    if excerpt:
+        excerpt = dict(excerpt)
+        length = probe.get('duration') if probe else None
+        if length:
+            # Recordings shorter than the offset are clipped from the start instead
+            if excerpt['start'] >= length:
+                excerpt['start'] = 0.0
+            excerpt['duration'] = min(excerpt['duration'], length - excerpt['start'])
+    can_copy = settings.get('stream_copy') and not (excerpt and (excerpt['fade_in'] or excerpt['fade_out']))
+    
+    if can_copy and probe and probe.get('codec') == 'mp3':
+        encoding = {'codec': 'copy'}
+    else:
+        encoding = {'codec': settings['codec'], 'bitrate': settings['bitrate']}
+    
+    if excerpt:
+        encoding['excerpt'] = excerpt
+    return encoding
+
+
+def _ffmpeg_input_args(audio_file, encoding):
+    args = []
+    excerpt = encoding.get('excerpt')
+    if excerpt and excerpt['start']:
+        # Seeking on the input is fast and makes output timestamps start at 0
+        args += ['-ss', f"{excerpt['start']:g}"]
+    return args + ['-i', str(audio_file)]
+
+
+def _ffmpeg_output_args(output_file, encoding, input_index=0, extra_args=()):
+    args = ['-map', f"{input_index}:a:0", '-vn', *extra_args]
+    excerpt = encoding.get('excerpt')
+    if excerpt:
+        args += ['-t', f"{excerpt['duration']:g}"]
+    
+    if encoding['codec'] == 'copy':
+        # Keep the existing MP3 stream as is
+        args += ['-c:a', 'copy']
+    else:
+        if excerpt:
+            filters = []
+            if excerpt['fade_in']:
+                filters.append(f"afade=t=in:st=0:d={excerpt['fade_in']:g}")
+            if excerpt['fade_out']:
+                fade_start = max(0.0, excerpt['duration'] - excerpt['fade_out'])
+                filters.append(f"afade=t=out:st={fade_start:g}:d={excerpt['fade_out']:g}")
+            if filters:
+                args += ['-af', ','.join(filters)]
+        args += ['-codec:a', encoding['codec'], '-b:a', encoding['bitrate']]
+    return args + ['-y', str(output_file)]
+
+
+def build_ffmpeg_command(audio_file, output_file, encoding, extra_args=()):
+    """Build the ffmpeg command line producing output_file with the chosen encoding"""
+    return build_ffmpeg_batch_command([(audio_file, output_file, encoding)], extra_args)
+
+
+def build_ffmpeg_batch_command(items, extra_args=()):
+    """Build one ffmpeg command converting several (audio_file, output_file, encoding) items.
+    
+    Every input gets its own mapped output, so a single process (and a
+    single codec initialisation) handles the whole batch.
+    """
+    command = ['ffmpeg']
+    for audio_file, output_file, encoding in items:
+        command += _ffmpeg_input_args(audio_file, encoding)
+    for index, (audio_file, output_file, encoding) in enumerate(items):
+        command += _ffmpeg_output_args(output_file, encoding, index, extra_args)
+    return command
+
+
+def _run_ffmpeg_conversion(audio_file, output_file, encoding, settings=MP3_ENCODER_SETTINGS, budget=None):
+    """Run a single ffmpeg conversion.
+    
+    Returns (source fingerprint, encoding used) on success or None. A failed
+    stream copy is retried once as a normal encode. A conversion killed for
+    exceeding the budget's timeout counts as failed.
+    """
+    budget = budget or ResourceBudget()
+    fingerprint = file_fingerprint(audio_file)
+    # Never write through a hardlink left by a previous placement
+    output_file.unlink(missing_ok=True)
+    try:
+        result = budget.run(build_ffmpeg_command(audio_file, output_file, encoding, budget.ffmpeg_args()),
+                            label=audio_file.name)
+        if result.returncode != 0 and encoding['codec'] == 'copy':
+            encoding = choose_encoding(None, {**settings, 'stream_copy': False})
+            result = budget.run(build_ffmpeg_command(audio_file, output_file, encoding, budget.ffmpeg_args()),
+                                label=audio_file.name)
+    except subprocess.TimeoutExpired:
+        output_file.unlink(missing_ok=True)
+        return None
+    return (fingerprint, encoding) if result.returncode == 0 else None
+
+
+def _run_ffmpeg_batch(items, settings=MP3_ENCODER_SETTINGS, budget=None):
+    """Convert a batch of (audio_file, output_file, encoding) items in one ffmpeg process.
+    
+    Returns one result per item, as for _run_ffmpeg_conversion. If the
+    batch fails or times out as a whole, each item is retried on its own so
+    a single bad file only fails itself.
+    """
+    budget = budget or ResourceBudget()
+    if len(items) == 1:
+        return [_run_ffmpeg_conversion(*items[0], settings, budget)]
+    
+    fingerprints = [file_fingerprint(item[0]) for item in items]
+    for item in items:
+        item[1].unlink(missing_ok=True)
+    try:
+        result = budget.run(build_ffmpeg_batch_command(items, budget.ffmpeg_args()), files=len(items))
+        if result.returncode == 0 and all(item[1].exists() for item in items):
+            return [(fingerprint, item[2]) for fingerprint, item in zip(fingerprints, items)]
+    except subprocess.TimeoutExpired:
+        pass
+    return [_run_ffmpeg_conversion(*item, settings, budget) for item in items]
+
+
+def convert_to_mp3(input_dir, output_dir="mp3_files", jobs=None, link_mode='copy', excerpt=None, dedupe='bytes',
+                   batch_size=1, budget=None, output_plan=None):
+    """Convert various audio formats to mp3 using ffmpeg, or copy existing MP3s if needed
+    
+    Conversions run in a pool of ``jobs`` workers (default: CPU count). A
+    manifest in the output directory records each source's fingerprint and
+    the settings used, so re-runs only process new or changed inputs and
+    outputs whose source has disappeared are removed. Existing MP3s are
+    placed in the output directory according to ``link_mode``.
+    
+    If ``excerpt`` is given (a dict overriding ``DEFAULT_EXCERPT``), each
+    output is a short clip cut during the same ffmpeg pass, and MP3 sources
+    are cut too instead of being copied.
+    
+    Duplicate sources are converted once (see ``find_duplicate_groups``);
+    ``dedupe`` is one of DEDUPE_MODES. With ``batch_size`` > 1 each worker
+    converts that many files per ffmpeg process.
+    
+    Every ffmpeg/ffprobe subprocess runs within ``budget`` (a
+    ResourceBudget); files killed on timeout are listed in the summary.
+    
+    ``output_plan`` maps source files to output paths relative to the
+    output directory, which may include subdirectories; sources missing
+    from it are left out. By default outputs are named after their source
+    (see ``plan_output_names``).
+    """
+    if jobs is None:
+        jobs = default_jobs()
+    jobs = max(1, int(jobs))
+    budget = budget or ResourceBudget()
+    
     input_path = Path(input_dir)
     output_path = Path(output_dir)
     
-    if not input_path.exists():
-        print(_("cli.error.input_directory_not_exist", input_dir=input_dir))
-        return False
+    if not input_path.exists():
+        print(_("cli.error.input_directory_not_exist", input_dir=input_dir))
+        return False
+    
+    output_path.mkdir(exist_ok=True)
+    
+    # Single pass over the tree, skipping the output directory if nested inside it
+    mp3_files = []
+    audio_files = []
+    for audio_file, ext in walk_audio_files(input_path, exclude=[output_path]):
+        if output_plan is None or audio_file in output_plan:
+            (mp3_files if ext == '.mp3' else audio_files).append(audio_file)
+    
+    # If no files to convert and no MP3s, return error
+    if not audio_files and not mp3_files:
+        print(_("cli.error.no_audio_files", input_dir=input_dir))
+        print(_("cli.info.supported_formats", extensions=', '.join(AUDIO_EXTENSIONS)))
+        return False
+    
+    settings = conversion_settings(excerpt)
+    if excerpt:
+        if input_path.resolve() == output_path.resolve():
+            print("Error: Excerpt mode needs an output directory different from the input directory")
+            return False
+        # Existing MP3s need cutting too, so they go through ffmpeg like everything else
+        audio_files += mp3_files
+        mp3_files = []
+    
+    # If input and output are the same directory and we have MP3s, no work needed
+    if input_path.resolve() == output_path.resolve() and mp3_files:
+        print(_("cli.info.input_contains_mp3", count=len(mp3_files)))
+        print(_("cli.info.no_conversion_needed"))
+        return True
+    
+    output_names = output_plan or plan_output_names(audio_files + mp3_files, input_path)
+    for parent in {(output_path / name).parent for name in output_names.values()}:
+        parent.mkdir(parents=True, exist_ok=True)
+    source_keys = {source.relative_to(input_path).as_posix(): name for source, name in output_names.items()}
+    manifest = load_manifest(output_path)
+    entries = manifest['entries']
+    
+    removed = remove_orphaned_outputs(output_path, entries, source_keys, output_names)
+    
+    converted = 0
+    remuxed = 0
+    deduplicated = 0
+    copied = 0
+    skipped = 0
+    failed = 0
+    total_operations = len(audio_files) + len(mp3_files)
+    current_op = 0
+    
+    def needs_work(source_file, settings):
+        """Skip sources whose manifest entry matches, adopting pre-manifest outputs"""
+        key = source_file.relative_to(input_path).as_posix()
+        output_file = output_path / output_names[source_file]
+        if is_up_to_date(entries.get(key), source_file, output_file, settings, output_names[source_file]):
+            return False
+        if key not in entries and 'excerpt' not in settings and output_file.exists() and \
+                output_file.stat().st_mtime >= source_file.stat().st_mtime:
+            entries[key] = {'output': output_names[source_file], 'settings': settings, **file_fingerprint(source_file)}
+            return False
+        return True
+    
+    def record(source_file, fingerprint, settings, encoding=None):
+        key = source_file.relative_to(input_path).as_posix()
+        entries[key] = {'output': output_names[source_file], 'settings': settings, **fingerprint}
+        if encoding:
+            entries[key]['encoding'] = encoding
+    
+    pending_conversions = []
+    for audio_file in audio_files:
+        if needs_work(audio_file, settings):
+            pending_conversions.append(audio_file)
+        else:
+            current_op += 1
+            print(f"[{current_op}/{total_operations}] Skipping (up to date): {audio_file.name}")
+            skipped += 1
+    
+    # Check if ffmpeg is available (only if we have files to convert)
+    if pending_conversions:
+        try:
+            subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            print(_("cli.error.ffmpeg_not_installed"))
+            print(_("cli.error.ffmpeg_install_help"))
+            if mp3_files:
+                print(_("cli.info.note_mp3_files", count=len(mp3_files)))
+            save_manifest(output_path, manifest)
+            return False
+    
+    try:
+        # Convert non-MP3 files
+        if pending_conversions:
+            workers = min(jobs, len(pending_conversions))
+            print(f"Found {len(pending_conversions)} audio files to convert ({workers} parallel jobs)")
+            
+            # Identical recordings are converted once and the result fanned out
+            aliases = {}
+            if dedupe != 'off':
+                for group in find_duplicate_groups(pending_conversions, audio=(dedupe == 'audio'), jobs=jobs, budget=budget):
+                    aliases[group[0]] = group[1:]
+                pending_conversions = list(aliases)
+                duplicate_count = sum(len(group) for group in aliases.values())
+                if duplicate_count:
+                    print(f"{duplicate_count} files are duplicates and will reuse another file's conversion")
+            
+            # Probe first so sources that already carry MP3 audio skip the encoder
+            probes = probe_audio_files(pending_conversions, jobs, budget)
+            encodings = {audio_file: choose_encoding(probes[audio_file], settings) for audio_file in pending_conversions}
+            stream_copies = sum(1 for encoding in encodings.values() if encoding['codec'] == 'copy')
+            if stream_copies:
+                print(f"{stream_copies} files already contain MP3 audio and will be remuxed without re-encoding")
+            
+            # Several files per ffmpeg process amortise its startup on short clips
+            # Never batch so coarsely that some workers sit idle
+            batch_size = max(1, min(int(batch_size), -(-len(pending_conversions) // jobs)))
+            batches = [pending_conversions[i:i + batch_size]
+                       for i in range(0, len(pending_conversions), batch_size)]
+            if batch_size > 1:
+                print(f"Converting in {len(batches)} batches of up to {batch_size} files")
+            
+            # Results are reported from this thread as they complete, so counters
+            # stay consistent whatever order the workers finish in
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = {executor.submit(_run_ffmpeg_batch,
+                                           [(audio_file, output_path / output_names[audio_file], encodings[audio_file])
+                                            for audio_file in batch],
+                                           settings, budget): batch
+                           for batch in batches}
+                
+                for future in as_completed(futures):
+                    batch = futures[future]
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        results = [e] * len(batch)
+                    
+                    for audio_file, result in zip(batch, results):
+                        output_name = output_names[audio_file]
+                        current_op += 1
+                        print(f"[{current_op}/{total_operations}] Converting: {audio_file.name}")
+                        
+                        if isinstance(result, Exception):
+                            print(f"  ✗ Error converting {audio_file.name}: {result}")
+                            result = None
+                            failed += 1
+                        elif result:
+                            fingerprint, encoding = result
+                            record(audio_file, fingerprint, settings, encoding)
+                            if encoding['codec'] == 'copy':
+                                print(f"  ✓ Success (remuxed): {output_name}")
+                                remuxed += 1
+                            else:
+                                print(f"  ✓ Success: {output_name}")
+                                converted += 1
+                        else:
+                            print(f"  ✗ Failed: {audio_file.name}")
+                            failed += 1
+                        
+                        for alias in aliases.get(audio_file, []):
+                            current_op += 1
+                            print(f"[{current_op}/{total_operations}] Duplicate of {audio_file.name}: {alias.name}")
+                            if not result:
+                                failed += 1
+                                continue
+                            try:
+                                place_file(output_path / output_name, output_path / output_names[alias], 'hardlink')
+                                record(alias, file_fingerprint(alias), settings, result[1])
+                                print(f"  ✓ Reused: {output_names[alias]}")
+                                deduplicated += 1
+                            except OSError as e:
+                                print(f"  ✗ Error copying {alias.name}: {e}")
+                                failed += 1
+        
+        # Copy existing MP3 files if output directory is different
+        if mp3_files:
+            if audio_files:
+                print(f"\nFound {len(mp3_files)} existing MP3 files to copy")
+            else:
+                print(f"Found {len(mp3_files)} MP3 files to copy to output directory")
+            
+            copy_settings = MP3_MOVE_SETTINGS if link_mode == 'move' else MP3_COPY_SETTINGS
+            for mp3_file in mp3_files:
+                current_op += 1
+                output_file = output_path / output_names[mp3_file]
+                
+                if not needs_work(mp3_file, copy_settings):
+                    print(f"[{current_op}/{total_operations}] Skipping (up to date): {mp3_file.name}")
+                    skipped += 1
+                    continue
+                
+                print(f"[{current_op}/{total_operations}] Copying: {mp3_file.name}")
+                
+                try:
+                    fingerprint = file_fingerprint(mp3_file)
+                    used_mode = place_file(mp3_file, output_file, link_mode)
+                    record(mp3_file, fingerprint, copy_settings)
+                    print(f"  ✓ Copied: {output_file.name}" + (f" ({used_mode})" if used_mode != 'copy' else ""))
+                    copied += 1
+                except Exception as e:
+                    print(f"  ✗ Error copying {mp3_file.name}: {e}")
+                    failed += 1
+    finally:
+        save_manifest(output_path, manifest)
+    
+    print(f"\n{_('cli.info.operation_complete')}")
+    if converted > 0:
+        print(_("cli.info.converted", count=converted))
+    if remuxed > 0:
+        print(f"  Remuxed without re-encoding: {remuxed}")
+    if deduplicated > 0:
+        print(f"  Duplicates reused: {deduplicated}")
+    if copied > 0:
+        print(_("cli.info.copied", count=copied))
+    if skipped > 0:
+        print(_("cli.info.skipped", count=skipped))
+    if removed > 0:
+        print(f"  Removed: {removed}")
+    if failed > 0:
+        print(_("cli.info.failed", count=failed))
+    if budget.killed:
+        killed = list(dict.fromkeys(budget.killed))
+        print(f"  Killed after timeout: {len(killed)}")
+        for name in killed:
+            print(f"    {name}")
+    print(_("cli.info.mp3_files_location", output_dir=output_dir))
+    
+    return (converted + remuxed + deduplicated + copied + skipped) > 0
+
+
+THESESSION_URL = "https://thesession.org"
+USER_AGENT = "irish-anki (+https://github.com/cyprienruffino/anki-thesession)"
+HTTP_TIMEOUT = 30
+
+# Politeness limits for thesession.org: on average one request every 2
+# seconds, with short bursts and a few requests in flight at once
+REQUEST_RATE = 0.5
+REQUEST_BURST = 4
+LOOKUP_CONCURRENCY = 4
+
+# Requests failing with these statuses (or timing out) are retried with
+# exponential backoff, waiting at most RETRY_AFTER_CAP for Retry-After
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+RETRY_AFTER_CAP = 300.0
+
+
+def create_http_session(pool_size=LOOKUP_CONCURRENCY, user_agent=USER_AGENT):
+    """Create a keep-alive requests.Session with a connection pool for the crawler.
+    
+    ``pool_size`` should be at least the number of lookups in flight, or
+    connections get discarded instead of kept alive.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'User-Agent': user_agent,
+        'Accept-Encoding': 'gzip, deflate',
+    })
+    return session
+
+
+_http_session = None
+
+
+def get_http_session():
+    """Get the shared HTTP session used by all crawler functions"""
+    global _http_session
+    if _http_session is None:
+        _http_session = create_http_session()
+    return _http_session
+
+
+def set_http_session(session):
+    """Replace the shared HTTP session (e.g. with one pointing at a stub server)"""
+    global _http_session
+    _http_session = session
+
+
+class TransientLookupError(Exception):
+    """A request kept failing with errors that may go away (timeouts, 429, 5xx)"""
+
+
+class CircuitBreaker:
+    """Pauses every request when too many recent ones have failed.
+    
+    Keeps the outcome of the last ``window`` requests. Once at least
+    ``min_requests`` are recorded and the share of failures reaches
+    ``threshold``, the circuit opens: ``wait`` blocks all callers for
+    ``cooldown`` seconds, then the history starts afresh.
+    """
+    
+    def __init__(self, threshold=0.5, window=20, min_requests=5, cooldown=60.0):
+        self.threshold = threshold
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        self.trips = 0
+        self._outcomes = deque(maxlen=window)
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+    
+    def record(self, success):
+        with self._lock:
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_requests and failures / len(self._outcomes) >= self.threshold:
+                print(f"Too many failed requests to thesession.org, pausing for {self.cooldown:.0f}s")
+                self._open_until = time.monotonic() + self.cooldown
+                self._outcomes.clear()
+                self.trips += 1
+    
+    def wait(self):
+        with self._lock:
+            delay = self._open_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+_circuit_breaker = None
+
+
+def get_circuit_breaker():
+    """Get the circuit breaker shared by all crawler requests"""
+    global _circuit_breaker
+    if _circuit_breaker is None:
+        _circuit_breaker = CircuitBreaker()
+    return _circuit_breaker
+
+
+def retry_after(response):
+    """Return the delay asked for by a Retry-After header (seconds or HTTP date), if any"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def http_get(url, session=None, params=None, retries=MAX_RETRIES, breaker=None, limiter=None):
+    """GET a thesession.org URL, retrying transient failures.
+    
+    Timeouts, connection errors and RETRY_STATUSES are retried with
+    exponential backoff and jitter, or after the server's Retry-After;
+    every attempt first waits for the circuit ``breaker`` (default: the
+    shared one), then takes a token from ``limiter`` if one is given.
+    Raises TransientLookupError once retries run out, and HTTPError
+    straight away for other error statuses.
+    """
+    session = session or get_http_session()
+    breaker = breaker or get_circuit_breaker()
+    for attempt in range(retries + 1):
+        breaker.wait()
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            response = session.get(url, params=params, timeout=HTTP_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error, delay = e, None
+        else:
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record(True)
+                response.raise_for_status()
+                return response
+            error, delay = f"HTTP {response.status_code}", retry_after(response)
+        breaker.record(False)
+        if attempt == retries:
+            break
+        if delay is None:
+            backoff = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)
+            delay = backoff / 2 + random.uniform(0, backoff / 2)
+        delay = min(delay, RETRY_AFTER_CAP)
+        print(f"  {error} from thesession.org, retrying in {delay:.1f}s")
+        time.sleep(delay)
+    raise TransientLookupError(f"{url}: {error}")
+
+
+def _search_tune(tune_name, session=None, limiter=None):
+    """Search thesession.org for a tune, raising on network errors"""
+    # Try the exact name first
+    search_url = f"{THESESSION_URL}/tunes/search?type=&mode=&q={quote_plus(tune_name)}"
+    
+    response = http_get(search_url, session, limiter=limiter)
+    
+    soup = BeautifulSoup(response.content, 'html.parser')
+    
+    # Look for the first tune result link
+    tune_links = soup.find_all('a', href=re.compile(r'/tunes/\d+'))
+    if tune_links:
+        first_tune_url = THESESSION_URL + tune_links[0]['href']
+        return first_tune_url
+    
+    # If no results found and tune doesn't start with "The ", try adding "The "
+    if not tune_name.lower().startswith('the '):
+        print(f"  No results for '{tune_name}', trying 'The {tune_name}'")
+        search_url_with_the = f"{THESESSION_URL}/tunes/search?type=&mode=&q={quote_plus('The ' + tune_name)}"
+        
+        response = http_get(search_url_with_the, session, limiter=limiter)
+        
+        soup = BeautifulSoup(response.content, 'html.parser')
+        tune_links = soup.find_all('a', href=re.compile(r'/tunes/\d+'))
+        if tune_links:
+            first_tune_url = THESESSION_URL + tune_links[0]['href']
+            return first_tune_url
+    
+    return None
+
+
+def search_tune_on_thesession(tune_name, session=None):
+    """Search for a tune on thesession.org and return the first result URL"""
+    try:
+        return _search_tune(tune_name, session)
+    except Exception as e:
+        print(f"Error searching for '{tune_name}': {e}")
+        return None
+
+
+ABC_HEADER_FIELDS = ('T:', 'R:', 'M:', 'L:', 'K:', 'X:', 'C:', 'O:', 'A:', 'N:', 'Z:', 'H:', 'S:', 'B:', 'F:', 'I:', 'P:')
+
+# Start of an ABC tune in page markup: "X:" at the start of a line or
+# right after a tag, as in <div class="notes">X: 1<br />T: ...
+ABC_START = re.compile(r'(?:^|>)[ \t]*(X:)', re.MULTILINE)
+ABC_LINE_BREAK = re.compile(r'<br\s*/?>|</?(?:div|p|pre)\b[^>]*>|\n', re.IGNORECASE)
+ABC_TAG = re.compile(r'<[^>]*>')
+ABC_WINDOW = 2048  # Header lines fit well within this many characters
+
+
+def _abc_header_lines(lines):
+    """Collect ABC header lines from X: until the first K: (or the music)"""
+    header = []
+    for line in lines:
+        line = line.strip()
+        if not header:
+            if line.startswith('X:'):
+                header.append(line)
+            continue
+        if not line:
+            continue
+        if not line.startswith(ABC_HEADER_FIELDS):
+            break
+        header.append(line)
+        if line.startswith('K:'):
+            break
+    return header
+
+
+def _abc_fields(header):
+    fields = {}
+    for line in header:
+        fields.setdefault(line[:2], line[2:].strip())
+    return fields.get('T:') or None, fields.get('R:') or None, fields.get('K:') or None
+
+
+def parse_abc_header(page):
+    """Find the first ABC tune in a page's HTML and return (title, rhythm, key).
+    
+    Only a small window of markup after the first "X:" is looked at, and
+    scanning stops at its K: header. Returns None if no complete header
+    (with T: and K:) is found that way.
+    """
+    for match in ABC_START.finditer(page):
+        window = page[match.start(1):match.start(1) + ABC_WINDOW]
+        lines = (html.unescape(ABC_TAG.sub('', line)) for line in ABC_LINE_BREAK.split(window))
+        header = _abc_header_lines(lines)
+        if any(line.startswith('K:') for line in header) and any(line.startswith('T:') for line in header):
+            return _abc_fields(header)
+    return None
+
+
+def _abc_from_page_text(page):
+    """Slow path: scan the whole page text for the ABC header"""
+    soup = BeautifulSoup(page, 'html.parser')
+    header = _abc_header_lines(soup.get_text().split('\n'))
+    if any(line.startswith('T:') for line in header) and any(line.startswith('K:') for line in header):
+        return header
+    return None
+
+
+def _fetch_abc_metadata(tune_url, session=None, limiter=None):
+    """Extract T:, R:, K: metadata from a tune page, raising on network errors"""
+    response = http_get(tune_url, session, limiter=limiter)
+    
+    metadata = parse_abc_header(response.text)
+    if metadata is not None:
+        return metadata
+    
+    header = _abc_from_page_text(response.content)
+    if not header:
+        print(f"  Could not find ABC notation section")
+        return None, None, None
+    
+    title, rhythm, key = _abc_fields(header)
+    if not all([title, rhythm, key]):
+        print(f"  Debug - ABC text found: {chr(10).join(header)[:300]}...")
+        print(f"  Debug - T: {title}, R: {rhythm}, K: {key}")
+    
+    return title, rhythm, key
+
+
+def extract_abc_metadata(tune_url, session=None):
+    """Extract T:, R:, K: metadata from the ABC notation on a tune page"""
+    try:
+        return _fetch_abc_metadata(tune_url, session)
+    except Exception as e:
+        print(f"Error extracting ABC metadata from {tune_url}: {e}")
+        return None, None, None
+
+
+class TuneResolver:
+    """Interface of thesession.org lookup backends.
+    
+    Both methods raise on network or format errors so callers can tell
+    them apart from a genuine "not found". Every HTTP request takes a
+    token from ``limiter``, if given.
+    """
+    
+    name = 'base'
+    
+    def __init__(self, session=None, limiter=None):
+        self.session = session
+        self.limiter = limiter
+    
+    def search(self, tune_name):
+        """Return the URL of the best matching tune, or None"""
+        raise NotImplementedError
+    
+    def metadata(self, tune_url):
+        """Return (title, rhythm, key) for a tune URL"""
+        raise NotImplementedError
+
+
+class HtmlResolver(TuneResolver):
+    """Scrapes the search and tune HTML pages"""
+    
+    name = 'html'
+    
+    def search(self, tune_name):
+        return _search_tune(tune_name, self.session, self.limiter)
+    
+    def metadata(self, tune_url):
+        return _fetch_abc_metadata(tune_url, self.session, self.limiter)
+
+
+def json_key_to_abc(key):
+    """Convert a thesession.org JSON key (e.g. 'Gmajor', 'F#dorian') to ABC form ('Gmaj', 'F#dor')"""
+    match = re.match(r'^([A-G][#b]?)([a-z]+)$', key or '')
+    if not match:
+        return key
+    root, mode = match.groups()
+    return root + mode[:3]
+
+
+class JsonResolver(TuneResolver):
+    """Uses the ?format=json search and tune endpoints, which return
+    structured type and key data in a fraction of the bytes of the HTML
+    pages."""
+    
+    name = 'json'
+    
+    def _get_json(self, url, **params):
+        return http_get(url, self.session, {**params, 'format': 'json'}, limiter=self.limiter).json()
+    
+    def _search(self, query):
+        data = self._get_json(f"{THESESSION_URL}/tunes/search", q=query)
+        tunes = data.get('tunes') or []
+        return f"{THESESSION_URL}/tunes/{tunes[0]['id']}" if tunes else None
+    
+    def search(self, tune_name):
+        tune_url = self._search(tune_name)
+        if tune_url is None and not tune_name.lower().startswith('the '):
+            print(f"  No results for '{tune_name}', trying 'The {tune_name}'")
+            tune_url = self._search('The ' + tune_name)
+        return tune_url
+    
+    def metadata(self, tune_url):
+        data = self._get_json(tune_url)
+        settings = data.get('settings') or [{}]
+        return data.get('name'), data.get('type'), json_key_to_abc(settings[0].get('key'))
+
+
+class FallbackResolver(TuneResolver):
+    """Tries several resolvers in order, moving on when one fails or
+    returns incomplete metadata. Transient failures are raised straight
+    away, since the next backend talks to the same server."""
+    
+    name = 'fallback'
+    
+    def __init__(self, resolvers):
+        super().__init__(resolvers[0].session, resolvers[0].limiter)
+        self.resolvers = resolvers
+    
+    def _first(self, method, *args, accept):
+        last_error = None
+        for resolver in self.resolvers:
+            try:
+                result = getattr(resolver, method)(*args)
+            except TransientLookupError:
+                raise
+            except Exception as e:
+                print(f"  {resolver.name} lookup failed ({e}), trying next backend")
+                last_error = e
+                continue
+            if accept(result) or resolver is self.resolvers[-1]:
+                return result
+        raise last_error
+    
+    def search(self, tune_name):
+        return self._first('search', tune_name, accept=lambda url: True)
+    
+    def metadata(self, tune_url):
+        return self._first('metadata', tune_url, accept=all)
+
+
+RESOLVER_BACKENDS = ['json', 'html']
+
+
+def create_resolver(backend='json', session=None, limiter=None):
+    """Create the resolver for a backend; the JSON one falls back to HTML scraping"""
+    if backend == 'html':
+        return HtmlResolver(session, limiter)
+    return FallbackResolver([JsonResolver(session, limiter), HtmlResolver(session, limiter)])
+
+
+CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'irish_anki'
+LOOKUP_CACHE_PATH = CACHE_DIR / 'lookups.sqlite'
+
+DAY = 24 * 60 * 60
+LOOKUP_TTL = 30 * DAY  # Tunes rarely change on thesession.org
+NEGATIVE_TTL = 1 * DAY  # "Not found" may change as tunes get added
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter.
+    
+    Up to ``burst`` requests may start at once, after which tokens refill
+    at ``rate`` per second. ``acquire`` reserves a token and sleeps until
+    it is due, so waiting callers are served in order. ``requests`` counts
+    the tokens handed out, and ``thread_requests`` those taken by the
+    calling thread.
+    """
+    
+    def __init__(self, rate=REQUEST_RATE, burst=REQUEST_BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.requests = 0
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+    
+    def thread_requests(self):
+        return getattr(self._local, 'requests', 0)
+    
+    def acquire(self):
+        self._local.requests = self.thread_requests() + 1
+        with self._lock:
+            self.requests += 1
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+def normalize_query(tune_name):
+    return ' '.join(tune_name.lower().split())
+
+
+class LookupCache:
+    """On-disk cache of thesession.org lookups.
+    
+    Maps normalised tune name -> tune URL and tune URL -> (T, R, K), with a
+    shorter TTL for "not found" answers. ``refresh`` ignores what is cached
+    (but still stores new answers); ``offline`` never touches the network
+    and treats cache misses as unresolved. Network errors are never cached,
+    and TransientLookupError is passed on to the caller.
+    Misses are looked up through ``resolver`` (default: ``create_resolver()``),
+    whose HTTP requests, retries included, each take a token from
+    ``limiter`` (default: a ``TokenBucket`` at the polite rate). A resolver
+    passed in should share that limiter, which also counts the requests.
+    Safe to use from several threads.
+    """
+    
+    def __init__(self, path=LOOKUP_CACHE_PATH, refresh=False, offline=False,
+                 ttl=LOOKUP_TTL, negative_ttl=NEGATIVE_TTL, resolver=None, limiter=None):
+        self.limiter = limiter or TokenBucket()
+        self.resolver = resolver or create_resolver(limiter=self.limiter)
+        self.refresh = refresh
+        self.offline = offline
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self._lock = threading.Lock()
+        
+        try:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: Could not open lookup cache {path}: {e}")
+            self._db = sqlite3.connect(':memory:', check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS searches '
+                             '(query TEXT PRIMARY KEY, tune_url TEXT, fetched_at REAL)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS tunes '
+                             '(tune_url TEXT PRIMARY KEY, title TEXT, rhythm TEXT, key TEXT, fetched_at REAL)')
+    
+    def _fresh(self, value, fetched_at):
+        ttl = self.ttl if value else self.negative_ttl
+        return time.time() - fetched_at < ttl
+    
+    def _get(self, sql, key):
+        if self.refresh:
+            return None
+        with self._lock:
+            return self._db.execute(sql, (key,)).fetchone()
+    
+    def _put(self, sql, values):
+        with self._lock, self._db:
+            self._db.execute(sql, (*values, time.time()))
+    
+    @property
+    def requests(self):
+        return self.limiter.requests
+    
+    def _hit(self):
+        with self._lock:
+            self.hits += 1
+    
+    def search(self, tune_name):
+        """Return (tune_url or None, requests made)"""
+        query = normalize_query(tune_name)
+        row = self._get('SELECT tune_url, fetched_at FROM searches WHERE query = ?', query)
+        if row and self._fresh(row[0], row[1]):
+            self._hit()
+            return row[0], 0
+        if self.offline:
+            return None, 0
+        
+        before = self.limiter.thread_requests()
+        try:
+            tune_url = self.resolver.search(tune_name)
+        except TransientLookupError:
+            raise
+        except Exception as e:
+            print(f"Error searching for '{tune_name}': {e}")
+            return None, self.limiter.thread_requests() - before
+        self._put('INSERT OR REPLACE INTO searches VALUES (?, ?, ?)', (query, tune_url))
+        return tune_url, self.limiter.thread_requests() - before
+    
+    def metadata(self, tune_url):
+        """Return ((title, rhythm, key), requests made)"""
+        row = self._get('SELECT title, rhythm, key, fetched_at FROM tunes WHERE tune_url = ?', tune_url)
+        if row and self._fresh(all(row[:3]), row[3]):
+            self._hit()
+            return tuple(row[:3]), 0
+        if self.offline:
+            return (None, None, None), 0
+        
+        before = self.limiter.thread_requests()
+        try:
+            metadata = self.resolver.metadata(tune_url)
+        except TransientLookupError:
+            raise
+        except Exception as e:
+            print(f"Error extracting ABC metadata from {tune_url}: {e}")
+            return (None, None, None), self.limiter.thread_requests() - before
+        self._put('INSERT OR REPLACE INTO tunes VALUES (?, ?, ?, ?, ?)', (tune_url, *metadata))
+        return metadata, self.limiter.thread_requests() - before
+    
+    def close(self):
+        self._db.close()
+
+
+CATALOG_PATH = CACHE_DIR / 'catalog.sqlite'
+
+
+def _read_dump_rows(path):
+    """Yield the rows of a thesession.org data dump file (.csv or .json) as dicts"""
+    path = Path(path)
+    if path.suffix.lower() == '.csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+    else:
+        with open(path, encoding='utf-8') as f:
+            yield from json.load(f)
+
+
+def _find_dump_file(root, stem):
+    for directory in (root, root / 'json', root / 'csv'):
+        for ext in ('.json', '.csv'):
+            candidate = directory / f"{stem}{ext}"
+            if candidate.exists():
+                return candidate
+    return None
+
+
+def build_catalog(dump_path, catalog_path=CATALOG_PATH, aliases_path=None):
+    """Index a thesession.org data dump into a local SQLite catalog.
+    
+    ``dump_path`` is the dump's tunes file (one row per setting, .json or
+    .csv) or a directory containing it, e.g. a checkout of the
+    TheSession-data repository. Aliases are read from ``aliases_path``, or
+    from the aliases file next to the tunes file. Only names, rhythms and
+    keys are kept, not the ABC. Returns (tune count, name count).
+    """
+    dump_path = Path(dump_path)
+    if dump_path.is_dir():
+        tunes_path = _find_dump_file(dump_path, 'tunes')
+        if aliases_path is None:
+            aliases_path = _find_dump_file(dump_path, 'aliases')
+    else:
+        tunes_path = dump_path
+        if aliases_path is None:
+            candidate = dump_path.with_name('aliases' + dump_path.suffix)
+            aliases_path = candidate if candidate.exists() else None
+    if tunes_path is None or not tunes_path.exists():
+        raise FileNotFoundError(f"No tunes.json or tunes.csv found in {dump_path}")
+    
+    tunes = {}
+    for row in _read_dump_rows(tunes_path):
+        tune = tunes.setdefault(int(row['tune_id']), {'name': row['name'], 'rhythm': row['type'], 'settings': []})
+        tune['settings'].append((int(row.get('setting_id') or 0), json_key_to_abc(row.get('mode'))))
+    
+    names = {(normalize_query(tune['name']), tune_id): 0 for tune_id, tune in tunes.items()}
+    if aliases_path is not None:
+        for row in _read_dump_rows(aliases_path):
+            tune_id = int(row['tune_id'])
+            if tune_id in tunes and row.get('alias'):
+                names.setdefault((normalize_query(row['alias']), tune_id), 1)
+    
+    catalog_path = Path(catalog_path)
+    catalog_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = catalog_path.with_name(catalog_path.name + '.tmp')
+    if temp_path.exists():
+        temp_path.unlink()
+    db = sqlite3.connect(str(temp_path))
+    try:
+        with db:
+            db.execute('CREATE TABLE tunes (tune_id INTEGER PRIMARY KEY, name TEXT, rhythm TEXT, keys TEXT)')
+            db.execute('CREATE TABLE names (name TEXT, tune_id INTEGER, is_alias INTEGER, '
+                       'PRIMARY KEY (name, tune_id)) WITHOUT ROWID')
+            # Keys in setting order, the first one being the tune's main key
+            db.executemany('INSERT INTO tunes VALUES (?, ?, ?, ?)', (
+                (tune_id, tune['name'], tune['rhythm'],
+                 ','.join(dict.fromkeys(key for setting, key in sorted(tune['settings']) if key)))
+                for tune_id, tune in tunes.items()))
+            db.executemany('INSERT INTO names VALUES (?, ?, ?)',
+                           ((name, tune_id, is_alias) for (name, tune_id), is_alias in names.items()))
+        db.execute('VACUUM')
+    finally:
+        db.close()
+    os.replace(temp_path, catalog_path)
+    return len(tunes), len(names)
+
+
+ARTICLES = {'the', 'a', 'an', 'na'}  # English and Irish
+TUNE_TYPE_WORDS = {'reel', 'reels', 'jig', 'jigs', 'slip', 'hornpipe', 'polka', 'slide', 'barndance',
+                   'march', 'waltz', 'mazurka', 'strathspey', 'set', 'dance', 'air'}
+# Irish surname prefixes are written joined, apart or with an apostrophe
+IRISH_PREFIXES = {'o': 'o', 'mac': 'mac', 'mc': 'mac', 'ni': 'ni', 'ui': 'ui'}
+
+MATCH_THRESHOLD = 0.8
+# Scores of names that only match once tune types are stripped ("Kesh Jig"
+# and "The Kesh"), depending on whether the stripped type fits the rhythm
+TYPE_STRIPPED_SCORE = 0.9
+RHYTHM_MATCH_BONUS = 0.05
+RHYTHM_MISMATCH_SCORE = 0.6
+
+
+def normalize_tune_name(name, strip_types=True):
+    """Reduce a tune name to a matching key.
+    
+    Strips accents, punctuation, track numbers, leading/trailing articles
+    and trailing tune types (unless ``strip_types`` is false), and joins
+    Irish surname prefixes, so that "03 - Kesh, The (Jig)" and "the kesh"
+    give the same key.
+    """
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(c for c in name if not unicodedata.combining(c)).lower()
+    name = re.sub(r"['’`]", '', name)
+    name = re.sub(r'[\W_]+', ' ', name)
+    words = name.split()
+    while len(words) > 1 and words[0].isdigit():
+        words.pop(0)
+    while len(words) > 1 and ((strip_types and words[-1] in TUNE_TYPE_WORDS) or words[-1] in ARTICLES):
+        words.pop()
+    while len(words) > 1 and words[0] in ARTICLES:
+        words.pop(0)
+    
+    joined = []
+    for word in words:
+        if joined and joined[-1] in IRISH_PREFIXES:
+            joined[-1] = IRISH_PREFIXES[joined[-1]] + word
+        else:
+            joined.append(IRISH_PREFIXES.get(word, word))
+    return ' '.join(joined)
+
+
+# Markers of extra copies of a recording at the end of a file name:
+# "Kesh (2)", "Kesh [3]", "Kesh - slow", "Kesh - Copy", "Kesh - take 2".
+# Words only count after a dash, so "Give and Take" keeps its last word.
+COPY_SUFFIX = re.compile(r'\s*(?:\(\d+\)|\[\d+\]|\s+-\s*(?:slow|fast|practice|copy|live|take\s*\d+))\s*$', re.IGNORECASE)
+
+
+def clean_tune_query(file_stem):
+    """Strip copy markers from a file name to get the tune name to look up"""
+    name = file_stem
+    while True:
+        stripped = COPY_SUFFIX.sub('', name)
+        if stripped == name or not stripped.strip():
+            return name.strip()
+        name = stripped
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def tune_type_words(name):
+    """Return the tune type words ``normalize_tune_name`` strips from the
+    end of a name, in the singular ("Kesh Reels" -> {'reel'})"""
+    full = normalize_tune_name(name, strip_types=False).split()
+    stripped = full[len(normalize_tune_name(name).split()):]
+    return frozenset(word[:-1] if word.endswith('s') else word for word in stripped)
+
+
+class TuneMatcher:
+    """In-memory fuzzy index of tune names.
+    
+    A name that is identical to the query, tune types included, scores
+    1.0. Names that only match once tune types are stripped score
+    TYPE_STRIPPED_SCORE, plus RHYTHM_MATCH_BONUS when the stripped type
+    is the candidate's rhythm, or RHYTHM_MISMATCH_SCORE when it names
+    another rhythm. Other candidates are scored by the Dice coefficient of
+    the trigrams of their stripped names, up to TYPE_STRIPPED_SCORE, and
+    those scoring under 0.5 are not returned. Equal scores go to the
+    candidate whose rhythm fits, then to the one added first.
+    """
     
-    output_path.mkdir(exist_ok=True)
+    def __init__(self, entries=()):
+        # Parallel lists indexed by position: value, rhythm words, trigram count
+        self._values = []
+        self._rhythms = []
+        self._grams = []
+        self._exact = {}
+        self._stripped = {}
+        self._index = {}
+        for entry in entries:
+            self.add(*entry)
     
-    # Check for existing MP3 files
-    mp3_files = list(input_path.glob("*.mp3"))
+    def add(self, name, value, rhythm=None):
+        key = normalize_tune_name(name, strip_types=False)
+        if not key or value in (self._values[position] for position in self._exact.get(key, ())):
+            return
+        stripped = normalize_tune_name(name)
+        position = len(self._values)
+        grams = trigrams(stripped)
+        self._values.append(value)
+        self._rhythms.append(frozenset((rhythm or '').lower().split()))
+        self._grams.append(len(grams))
+        self._exact.setdefault(key, []).append(position)
+        self._stripped.setdefault(stripped, []).append(position)
+        for gram in grams:
+            self._index.setdefault(gram, []).append(position)
     
-    # Supported audio formats for conversion (excluding MP3)
-    audio_extensions = ['.m4a', '.wav', '.flac', '.aac', '.ogg', '.mp4', '.webm']
+    def _fit(self, types, position):
+        """1 if the query's tune types are the candidate's rhythm, -1 if
+        they name another one, 0 if either is unknown"""
+        rhythm = self._rhythms[position]
+        if not types or not rhythm:
+            return 0
+        return 1 if types == rhythm else -1
     
-    audio_files = []
-    for ext in audio_extensions:
-        audio_files.extend(input_path.rglob(f'*{ext}'))
+    def match(self, name, limit=5):
+        """Return up to ``limit`` (score, value) pairs, best first"""
+        key = normalize_tune_name(name, strip_types=False)
+        if not key:
+            return []
+        types = tune_type_words(name)
+        if key in self._exact:
+            positions = sorted(self._exact[key], key=lambda position: -self._fit(types, position))
+            return [(1.0, self._values[position]) for position in positions[:limit]]
+        
+        stripped = normalize_tune_name(name)
+        scores = {}
+        for position in self._stripped.get(stripped, ()):
+            fit = self._fit(types, position)
+            scores[position] = RHYTHM_MISMATCH_SCORE if fit < 0 else TYPE_STRIPPED_SCORE + fit * RHYTHM_MATCH_BONUS
+        grams = trigrams(stripped)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._index.get(gram, ()))
+        # Sharing under a third of the query's trigrams caps the score at 0.5,
+        # so those candidates are not worth scoring
+        floor = len(grams) / 3
+        for position, count in shared.items():
+            if count >= floor and position not in scores:
+                scores[position] = min(2 * count / (len(grams) + self._grams[position]), TYPE_STRIPPED_SCORE)
+        # A tune's name and aliases may all match: only its best one counts
+        best = {}
+        for position, score in scores.items():
+            ranked = (score, self._fit(types, position), -position)
+            value = self._values[position]
+            if value not in best or ranked > best[value]:
+                best[value] = ranked
+        return [(round(score, 3), self._values[-position])
+                for score, fit, position in heapq.nlargest(limit, best.values())]
     
-    # If no files to convert and no MP3s, return error
-    if not audio_files and not mp3_files:
-        print(_("cli.error.no_audio_files", input_dir=input_dir))
-        print(_("cli.info.supported_formats", extensions=', '.join(audio_extensions)))
-        return False
+    def __len__(self):
+        return len(self._values)
+
+
+class TuneCatalog:
+    """Read-only lookups in a catalog built by ``build_catalog``.
     
-    # If input and output are the same directory and we have MP3s, no work needed
-    if input_path.resolve() == output_path.resolve() and mp3_files:
-        print(_("cli.info.input_contains_mp3", count=len(mp3_files)))
-        print(_("cli.info.no_conversion_needed"))
-        return True
+    Names are matched exactly first, then through a ``TuneMatcher`` over
+    every name and alias, built on first use.
+    """
     
-    # Check if ffmpeg is available (only if we have files to convert)
-    if audio_files:
-        try:
-            subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            print(_("cli.error.ffmpeg_not_installed"))
-            print(_("cli.error.ffmpeg_install_help"))
-            if mp3_files:
-                print(_("cli.info.note_mp3_files", count=len(mp3_files)))
-            return False
+    def __init__(self, path=CATALOG_PATH, threshold=MATCH_THRESHOLD):
+        self.path = Path(path)
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.threshold = threshold
+        self._matcher = None
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path.resolve().as_uri() + '?mode=ro', uri=True, check_same_thread=False)
     
-    converted = 0
-    copied = 0
-    skipped = 0
-    failed = 0
-    total_operations = len(audio_files) + len(mp3_files)
-    current_op = 0
+    def _find(self, query):
+        with self._lock:
+            return self._db.execute(
+                'SELECT t.tune_id, t.name, t.rhythm, t.keys FROM names n JOIN tunes t USING (tune_id) '
+                'WHERE n.name = ? ORDER BY n.is_alias, t.tune_id LIMIT 1', (query,)).fetchone()
     
-    # Convert non-MP3 files
-    if audio_files:
-        print(f"Found {len(audio_files)} audio files to convert")
-        
-        for audio_file in audio_files:
-            current_op += 1
-            filename_no_ext = audio_file.stem
-            output_file = output_path / f"{filename_no_ext}.mp3"
-            
-            if output_file.exists():
-                print(f"[{current_op}/{total_operations}] Skipping (already exists): {audio_file.name}")
-                skipped += 1
-                continue
-            
-            print(f"[{current_op}/{total_operations}] Converting: {audio_file.name}")
-            
-            try:
-                # Convert to mp3 with good quality settings
-                result = subprocess.run([
-                    'ffmpeg', '-i', str(audio_file),
-                    '-codec:a', 'libmp3lame',
-                    '-b:a', '192k',
-                    '-y', str(output_file)
-                ], capture_output=True, text=True)
-                
-                if result.returncode == 0:
-                    print(f"  ✓ Success: {filename_no_ext}.mp3")
-                    converted += 1
-                else:
-                    print(f"  ✗ Failed: {audio_file.name}")
-                    failed += 1
-                    
-            except Exception as e:
-                print(f"  ✗ Error converting {audio_file.name}: {e}")
-                failed += 1
+    def _tune(self, tune_id):
+        with self._lock:
+            return self._db.execute('SELECT tune_id, name, rhythm, keys FROM tunes WHERE tune_id = ?',
+                                    (tune_id,)).fetchone()
     
-    # Copy existing MP3 files if output directory is different
-    if mp3_files:
-        if audio_files:
-            print(f"\nFound {len(mp3_files)} existing MP3 files to copy")
-        else:
-            print(f"Found {len(mp3_files)} MP3 files to copy to output directory")
-        
-        for mp3_file in mp3_files:
-            current_op += 1
-            output_file = output_path / mp3_file.name
-            
-            if output_file.exists():
-                print(f"[{current_op}/{total_operations}] Skipping (already exists): {mp3_file.name}")
-                skipped += 1
-                continue
-            
-            print(f"[{current_op}/{total_operations}] Copying: {mp3_file.name}")
-            
-            try:
-                shutil.copy2(str(mp3_file), str(output_file))
-                print(f"  ✓ Copied: {mp3_file.name}")
-                copied += 1
-            except Exception as e:
-                print(f"  ✗ Error copying {mp3_file.name}: {e}")
-                failed += 1
+    def _result(self, row):
+        tune_id, title, rhythm, keys = row
+        return f"{THESESSION_URL}/tunes/{tune_id}", (title, rhythm, keys.split(',')[0] or None)
     
-    print(f"\n{_('cli.info.operation_complete')}")
-    if converted > 0:
-        print(_("cli.info.converted", count=converted))
-    if copied > 0:
-        print(_("cli.info.copied", count=copied))
-    if skipped > 0:
-        print(_("cli.info.skipped", count=skipped))
-    if failed > 0:
-        print(_("cli.info.failed", count=failed))
-    print(_("cli.info.mp3_files_location", output_dir=output_dir))
+    @property
+    def matcher(self):
+        with self._lock:
+            if self._matcher is None:
+                # Main names first so they win ties with aliases
+                rows = self._db.execute('SELECT n.name, n.tune_id, t.rhythm FROM names n JOIN tunes t USING (tune_id) '
+                                        'ORDER BY n.is_alias, n.tune_id').fetchall()
+                self._matcher = TuneMatcher(rows)
+            return self._matcher
     
-    return (converted + copied) > 0
+    def match(self, tune_name, limit=5):
+        """Return up to ``limit`` ranked (score, tune_url, title) candidates"""
+        candidates = []
+        for score, tune_id in self.matcher.match(tune_name, limit):
+            tune_url, (title, rhythm, key) = self._result(self._tune(tune_id))
+            candidates.append((score, tune_url, title))
+        return candidates
+    
+    def lookup(self, tune_name):
+        """Return (tune_url, (title, rhythm, key)), or None if no name in the
+        catalog matches with at least ``threshold`` score"""
+        query = normalize_query(tune_name)
+        row = self._find(query)
+        if row is None and not query.startswith('the '):
+            row = self._find('the ' + query)
+        if row is None:
+            matches = self.matcher.match(tune_name, 1)
+            if not matches or matches[0][0] < self.threshold:
+                return None
+            score, tune_id = matches[0]
+            row = self._tune(tune_id)
+            print(f"  Matched '{tune_name}' to '{row[1]}' (score {score:.2f})")
+            with self._lock:
+                self.fuzzy_hits += 1
+        with self._lock:
+            self.hits += 1
+        return self._result(row)
+    
+    def close(self):
+        self._db.close()
 
 
-def search_tune_on_thesession(tune_name):
-    """Search for a tune on thesession.org and return the first result URL"""
-    # Try the exact name first
-    search_url = f"https://thesession.org/tunes/search?type=&mode=&q={quote_plus(tune_name)}"
-    
-    try:
-        response = requests.get(search_url, timeout=30)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Look for the first tune result link
-        tune_links = soup.find_all('a', href=re.compile(r'/tunes/\d+'))
-        if tune_links:
-            first_tune_url = "https://thesession.org" + tune_links[0]['href']
-            return first_tune_url
-        
-        # If no results found and tune doesn't start with "The ", try adding "The "
-        if not tune_name.lower().startswith('the '):
-            print(f"  No results for '{tune_name}', trying 'The {tune_name}'")
-            search_url_with_the = f"https://thesession.org/tunes/search?type=&mode=&q={quote_plus('The ' + tune_name)}"
-            
-            response = requests.get(search_url_with_the, timeout=30)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            tune_links = soup.find_all('a', href=re.compile(r'/tunes/\d+'))
-            if tune_links:
-                first_tune_url = "https://thesession.org" + tune_links[0]['href']
-                return first_tune_url
-        
+def open_catalog(path=CATALOG_PATH, threshold=MATCH_THRESHOLD):
+    """Open the catalog at ``path``, or return None if none has been built there"""
+    if not Path(path).exists():
         return None
-        
-    except Exception as e:
-        print(f"Error searching for '{tune_name}': {e}")
+    try:
+        return TuneCatalog(path, threshold)
+    except sqlite3.Error as e:
+        print(f"Warning: Could not open tune catalog {path}: {e}")
         return None
 
 
-def extract_abc_metadata(tune_url):
-    """Extract T:, R:, K: metadata from the ABC notation on a tune page"""
+def lookup_tune(tune_name, cache, catalog=None):
+    """Resolve a tune name, returning ((tune_url, (title, rhythm, key)), requests made).
+    
+    The local ``catalog`` is tried first (unless the cache is refreshing),
+    then the lookup cache and the network. Raises TransientLookupError
+    when thesession.org kept failing.
+    """
+    if catalog is not None and not cache.refresh:
+        found = catalog.lookup(tune_name)
+        if found:
+            return found, 0
+    tune_url, searched = cache.search(tune_name)
+    if not tune_url:
+        return (None, (None, None, None)), searched
+    metadata, fetched = cache.metadata(tune_url)
+    return (tune_url, metadata), searched + fetched
+
+
+def _lookup_or_none(tune_name, cache, catalog):
     try:
-        response = requests.get(tune_url, timeout=30)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        abc_text = None
+        return lookup_tune(tune_name, cache, catalog)
+    except TransientLookupError as e:
+        print(f"Lookup of '{tune_name}' failed temporarily: {e}")
+        return None, 0
 
-        if not abc_text:
-            all_text = soup.get_text()
-            lines = all_text.split('\n')
-            abc_lines = []
-            in_abc_section = False
-            
-            for line in lines:
-                line = line.strip()
-                if line.startswith('X:'):
-                    in_abc_section = True
-                    abc_lines = [line]
-                elif in_abc_section:
-                    abc_lines.append(line)
-                    # Stop when we hit musical notation or next section
-                    if line.startswith('|') or (line and not any(line.startswith(prefix) for prefix in ['T:', 'R:', 'M:', 'L:', 'K:', 'X:', 'C:', 'O:', 'A:', 'N:', 'Z:', 'H:', 'S:', 'B:', 'F:', 'I:', 'P:'])):
-                        break
-                    # If we have enough ABC headers, we can stop looking
-                    if any(l.startswith('K:') for l in abc_lines):
-                        break
-            
-            if abc_lines and any(l.startswith('T:') for l in abc_lines) and any(l.startswith('K:') for l in abc_lines):
-                abc_text = '\n'.join(abc_lines)
-        
-        if not abc_text:
-            print(f"  Could not find ABC notation section")
-            return None, None, None
-        
-        title_match = re.search(r'^T:\s*(.+)$', abc_text, re.MULTILINE)
-        rhythm_match = re.search(r'^R:\s*(.+)$', abc_text, re.MULTILINE)
-        key_match = re.search(r'^K:\s*(.+)$', abc_text, re.MULTILINE)
-        
-        title = title_match.group(1).strip() if title_match else None
-        rhythm = rhythm_match.group(1).strip() if rhythm_match else None
-        key = key_match.group(1).strip() if key_match else None
-        
-        if not all([title, rhythm, key]):
-            print(f"  Debug - ABC text found: {abc_text[:300]}...")
-            print(f"  Debug - T: {title}, R: {rhythm}, K: {key}")
-        
-        return title, rhythm, key
-        
-    except Exception as e:
-        print(f"Error extracting ABC metadata from {tune_url}: {e}")
-        return None, None, None
+
+def iter_resolved_tunes(tune_names, cache, concurrency=LOOKUP_CONCURRENCY, catalog=None, queue_size=None):
+    """Resolve several tune names concurrently, yielding (index, result,
+    requests made) as each lookup completes. The result is None when the
+    lookup failed temporarily.
+    
+    Up to ``concurrency`` lookups are in flight at once; the request rate
+    itself is bounded by the cache's limiter, and cache hits never wait.
+    Lookups are started at most ``queue_size`` (default: twice the
+    concurrency) ahead of those in flight, as the results are consumed,
+    so they pause when the consumer falls behind.
+    """
+    concurrency = max(1, concurrency)
+    window = concurrency + (queue_size or 2 * concurrency)
+    names = enumerate(tune_names)
+    pending = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        try:
+            while True:
+                for index, tune_name in itertools.islice(names, window - len(pending)):
+                    pending[executor.submit(_lookup_or_none, tune_name, cache, catalog)] = index
+                if not pending:
+                    break
+                for future in wait(pending, return_when=FIRST_COMPLETED).done:
+                    result, request_count = future.result()
+                    yield pending.pop(future), result, request_count
+        finally:
+            for future in pending:
+                future.cancel()
 
 
 def sanitize_filename(filename):
@@ -245,8 +1797,93 @@ def sanitize_filename(filename):
     return filename
 
 
-def organize_music_files(input_dir, export_dir="export"):
-    """Organize mp3 files by crawling thesession.org for metadata"""
+JOURNAL_NAME = ".irish_anki_journal.jsonl"
+REQUEUE_ROUNDS = 2  # Extra passes over lookups that failed temporarily
+
+
+class OrganizeJournal:
+    """Write-ahead journal of an organize run, kept in the export directory.
+    
+    One JSON line is appended per source file and step: ``resolved`` once
+    its lookup is done, ``moving`` right before it is moved (in move mode),
+    then ``placed``, ``unknown`` or ``failed``. Lines
+    are flushed as they are written, so an interrupted run can be resumed
+    from the last state of each file. Entries only count while the source
+    file's size and mtime are unchanged.
+    """
+    
+    def __init__(self, export_path, resume=False):
+        self.path = Path(export_path) / JOURNAL_NAME
+        self.entries = self._load() if resume else {}
+        self._file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+    
+    def _load(self):
+        entries = {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Line cut short by a crash
+                    entries[entry['source']] = entry
+        except OSError:
+            pass
+        return entries
+    
+    def _entry(self, source):
+        entry = self.entries.get(source.name)
+        stat = source.stat()
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            return entry
+        return None
+    
+    def record(self, source, status, **fields):
+        try:
+            stat = source.stat()
+            size, mtime = stat.st_size, stat.st_mtime_ns
+        except FileNotFoundError:  # Moved into the export directory since it was resolved
+            previous = self.entries[source.name]
+            size, mtime = previous['size'], previous['mtime']
+        entry = {'source': source.name, 'size': size, 'mtime': mtime, 'status': status, **fields}
+        self.entries[source.name] = entry
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+    
+    def completed(self, source):
+        """Return the journal entry if the file was placed (or sent to unknown) and is still there"""
+        entry = self._entry(source)
+        if entry and entry['status'] in ('placed', 'unknown') and Path(entry['target']).exists():
+            return entry
+        return None
+    
+    def resolution(self, source):
+        """Return the (tune_url, (title, rhythm, key)) recorded for the file, if any"""
+        entry = self._entry(source)
+        if entry and entry['status'] in ('resolved', 'moving') and 'tune_url' in entry:
+            return entry['tune_url'], (entry['title'], entry['rhythm'], entry['key'])
+        return None
+    
+    def close(self):
+        self._file.close()
+
+
+def organize_music_files(input_dir, export_dir="export", link_mode='copy', dedupe='bytes', budget=None,
+                         cache=None, lookup_jobs=LOOKUP_CONCURRENCY, catalog=None, resume=False):
+    """Organize mp3 files by crawling thesession.org for metadata
+    
+    Files are placed into the export layout according to ``link_mode``
+    (see ``place_file``). Duplicate recordings, and files whose names only
+    differ by articles, case, punctuation or copy markers such as "(2)" or
+    "- slow", are looked up once. Lookups go through ``cache`` (a LookupCache, opened at the default
+    location if not given), ``lookup_jobs`` of them at a time. Names found
+    in ``catalog`` (a TuneCatalog, the default one if it has been built)
+    need no lookup at all.
+    
+    Progress is journaled in the export directory; with ``resume``, files
+    completed by a previous run are skipped and files whose lookup was
+    done are placed without looking them up again.
+    """
     input_path = Path(input_dir)
     if not input_path.exists():
         print(_("cli.error.directory_not_exist", input_dir=input_dir))
@@ -258,7 +1895,10 @@ def organize_music_files(input_dir, export_dir="export"):
     export_path.mkdir(exist_ok=True)
     unknown_path.mkdir(exist_ok=True)
     
-    mp3_files = list(input_path.glob("*.mp3"))
+    # Sorted so that, as in convert_into_export, the first file in path
+    # order wins when several recordings resolve to the same target
+    mp3_files = sorted((mp3_file for mp3_file, ext in walk_audio_files(input_path, ('.mp3',), max_depth=0)),
+                       key=lambda f: f.name)
     if not mp3_files:
         print(_("cli.error.no_audio_files", input_dir=input_dir))
         return False
@@ -266,37 +1906,154 @@ def organize_music_files(input_dir, export_dir="export"):
     print(_("cli.info.found_mp3_process", count=len(mp3_files)))
     print(_("cli.info.starting_processing"))
     
+    owns_cache = cache is None
+    if owns_cache:
+        cache = LookupCache()
+    owns_catalog = catalog is None
+    if owns_catalog:
+        catalog = open_catalog()
+    
     processed = []
     unknown_files = []
+    transient_failures = []
+    collisions = []
     errors = []
     
-    for i, mp3_file in enumerate(mp3_files, 1):
+    groups = [[mp3_file] for mp3_file in mp3_files]
+    if dedupe != 'off':
+        groups = find_duplicate_groups(mp3_files, audio=(dedupe == 'audio'), budget=budget)
+        if len(groups) < len(mp3_files):
+            print(f"Found {len(mp3_files) - len(groups)} duplicate recordings, looking each one up once")
+    
+    journal = OrganizeJournal(export_path, resume)
+    resumed = 0
+    remaining = []
+    for group in groups:
+        done = [journal.completed(member) for member in group]
+        if not all(done):
+            remaining.append(group)
+            continue
+        resumed += len(group)
+        for member, entry in zip(group, done):
+            if entry['status'] == 'unknown':
+                unknown_files.append(member.stem)
+            else:
+                processed.append({'original': member.stem, 'title': entry['title'], 'rhythm': entry['rhythm'],
+                                  'key': entry['key'], 'new_path': entry['target']})
+    if resumed:
+        print(f"Resuming: {resumed} files already organized by the previous run")
+    groups = remaining
+    
+    def commit_move(member, target, **fields):
+        # Written ahead of the move: if the run dies mid-way, the journal
+        # says where the audio went, and a source still in place is redone
+        if link_mode == 'move':
+            journal.record(member, 'moving', target=str(target), **fields)
+    
+    def collided(group, target, error):
+        print(f"  Not placed: a different recording is already at {target}")
+        for member in group:
+            collisions.append(f"{member.stem} -> {target.relative_to(export_path)}")
+            journal.record(member, 'failed', error=str(error))
+    
+    def place_unknown(group):
+        for member in group:
+            try:
+                commit_move(member, unknown_path / member.name)
+                place_file(member, unknown_path / member.name, link_mode)
+                unknown_files.append(member.stem)
+                journal.record(member, 'unknown', target=str(unknown_path / member.name))
+            except FileExistsError as e:
+                collided([member], unknown_path / member.name, e)
+            except Exception as e:
+                errors.append(f"Failed to copy {member.stem}: {e}")
+                journal.record(member, 'failed', error=str(e))
+    
+    shared = {'lookups': 0, 'requests': 0}
+    
+    def resolutions():
+        # Groups whose names normalise to the same query share one lookup
+        pending = {}
+        for index, group in enumerate(groups):
+            known = journal.resolution(group[0])
+            if known:
+                yield index, known
+                continue
+            query = clean_tune_query(group[0].stem)
+            key = normalize_tune_name(query, strip_types=False) or query
+            pending.setdefault(key, (query, []))[1].append(index)
+        lookups = list(pending.values())
+        if len(lookups) < sum(len(indices) for query, indices in lookups):
+            print(f"Looking up {len(lookups)} distinct tune names")
+        
+        # Lookups that failed temporarily are queued again after the others,
+        # and given up on (None) after REQUEUE_ROUNDS more attempts
+        for attempt in range(REQUEUE_ROUNDS + 1):
+            if attempt:
+                print(f"\nRetrying {len(lookups)} lookups that failed temporarily...")
+            failed = []
+            for position, result, request_count in iter_resolved_tunes([query for query, indices in lookups],
+                                                                       cache, lookup_jobs, catalog):
+                indices = lookups[position][1]
+                if result is None and attempt < REQUEUE_ROUNDS:
+                    failed.append(lookups[position])
+                    continue
+                shared['lookups'] += len(indices) - 1
+                shared['requests'] += (len(indices) - 1) * request_count
+                for index in indices:
+                    if result is not None:
+                        tune_url, (title, rhythm, key) = result
+                        for member in groups[index]:
+                            journal.record(member, 'resolved', tune_url=tune_url, title=title, rhythm=rhythm, key=key)
+                    yield index, result
+            lookups = failed
+            if not lookups:
+                break
+    
+    def in_order(results):
+        # Lookups finish in any order, but files are placed in group order
+        # so that the same file wins a contested target on every run
+        waiting = {}
+        next_index = 0
+        for index, result in results:
+            waiting[index] = result
+            while next_index in waiting:
+                yield next_index, waiting.pop(next_index)
+                next_index += 1
+    
+    # Targets placed by this run: a different recording of the same tune
+    # must not replace one of them, whatever the link mode
+    placed_targets = set()
+    
+    # Files are placed as soon as every earlier one is, while later
+    # lookups are still in flight
+    for i, (index, result) in enumerate(in_order(resolutions()), 1):
+        group = groups[index]
+        mp3_file = group[0]
         tune_name = mp3_file.stem
-        print(f"\n[{i}/{len(mp3_files)}] Processing: {tune_name}")
+        print(f"\n[{i}/{len(groups)}] Processing: {tune_name}")
+        if len(group) > 1:
+            print(f"  Same recording as: {', '.join(member.name for member in group[1:])}")
+        
+        # Not sent to unknown: the tune may well exist, the site was just unavailable
+        if result is None:
+            print(f"  Lookup failed temporarily, leaving it for the next run")
+            for member in group:
+                transient_failures.append(member.stem)
+                journal.record(member, 'failed', error='lookup failed temporarily')
+            continue
         
-        tune_url = search_tune_on_thesession(tune_name)
+        tune_url, (title, rhythm, key) = result
         if not tune_url:
             print(f"  No results found, copying to unknown")
-            try:
-                shutil.copy2(str(mp3_file), str(unknown_path / mp3_file.name))
-                unknown_files.append(tune_name)
-            except Exception as e:
-                errors.append(f"Failed to copy {tune_name}: {e}")
-            respectful_delay()
+            place_unknown(group)
             continue
         
         print(f"  Found: {tune_url}")
-        respectful_delay()
         
-        title, rhythm, key = extract_abc_metadata(tune_url)
         if not all([title, rhythm, key]):
             print(f"  Could not extract complete metadata (T:{title}, R:{rhythm}, K:{key}), copying to unknown")
-            try:
-                shutil.copy2(str(mp3_file), str(unknown_path / mp3_file.name))
-                unknown_files.append(tune_name)
-            except Exception as e:
-                errors.append(f"Failed to copy {tune_name}: {e}")
-            respectful_delay()
+            place_unknown(group)
             continue
         
         print(f"  Metadata - Title: {title}, Rhythm: {rhythm}, Key: {key}")
@@ -309,39 +2066,81 @@ def organize_music_files(input_dir, export_dir="export"):
         new_filename = f"{safe_title} ({safe_key}).mp3"
         target_path = rhythm_dir / new_filename
         
+        # Duplicates all resolve to the same target, so it's placed only once
         try:
-            shutil.copy2(str(mp3_file), str(target_path))
-            processed.append({
-                'original': tune_name,
-                'title': title,
-                'rhythm': rhythm,
-                'key': key,
-                'new_path': str(target_path)
-            })
-            print(f"  Copied to: {target_path}")
+            if target_path in placed_targets and not filecmp.cmp(mp3_file, target_path, shallow=False):
+                raise FileExistsError(errno.EEXIST, "A different file is already there", str(target_path))
+            commit_move(mp3_file, target_path, tune_url=tune_url, title=title, rhythm=rhythm, key=key)
+            used_mode = place_file(mp3_file, target_path, link_mode)
+            placed_targets.add(target_path)
+            for member in group:
+                processed.append({
+                    'original': member.stem,
+                    'title': title,
+                    'rhythm': rhythm,
+                    'key': key,
+                    'new_path': str(target_path)
+                })
+                journal.record(member, 'placed', target=str(target_path), title=title, rhythm=rhythm, key=key)
+            if used_mode == 'move':
+                print(f"  Moved to: {target_path}")
+            else:
+                print(f"  Copied to: {target_path}" + (f" ({used_mode})" if used_mode != 'copy' else ""))
+        except FileExistsError as e:
+            collided(group, target_path, e)
         except Exception as e:
             errors.append(f"Failed to copy {tune_name}: {e}")
-        
-        respectful_delay()
+            for member in group:
+                journal.record(member, 'failed', error=str(e))
+    journal.close()
     
     print(f"\n{'='*60}")
     print("ORGANIZATION SUMMARY")
     print(f"{'='*60}")
     print(f"Total files processed: {len(mp3_files)}")
     print(f"Successfully organized: {len(processed)}")
+    if resumed:
+        print(f"Already organized by the previous run: {resumed}")
     print(f"Moved to unknown: {len(unknown_files)}")
+    if transient_failures:
+        print(f"Lookups failed temporarily: {len(transient_failures)} (run again with --resume)")
+    if collisions:
+        print(f"Not placed, target taken by a different recording: {len(collisions)}")
+    if len(groups) < len(mp3_files):
+        print(f"Duplicates looked up once: {len(mp3_files) - len(groups)}")
+    if catalog is not None:
+        print(f"Resolved from local catalog: {catalog.hits} ({catalog.fuzzy_hits} by fuzzy match)")
+        if owns_catalog:
+            catalog.close()
+    if shared['lookups']:
+        print(f"Lookups shared by tune name: {shared['lookups']} "
+              f"(saved {shared['requests']} requests to thesession.org)")
+    print(f"Lookups answered from cache: {cache.hits}")
+    print(f"Requests to thesession.org: {cache.requests}")
+    if owns_cache:
+        cache.close()
     print(f"Errors: {len(errors)}")
     
     if processed:
         print(f"\nSuccessfully organized files:")
-        for item in processed:
+        for item in sorted(processed, key=lambda item: item['original']):
             print(f"  {item['original']} -> {item['rhythm']}/{item['title']} ({item['key']}).mp3")
     
     if unknown_files:
         print(f"\nFiles moved to unknown (not found or incomplete metadata):")
-        for filename in unknown_files:
+        for filename in sorted(unknown_files):
+            print(f"  {filename}")
+    
+    if transient_failures:
+        print(f"\nFiles not organized because thesession.org was unavailable:")
+        for filename in sorted(transient_failures):
             print(f"  {filename}")
     
+    if collisions:
+        print(f"\nFiles left in place because a different recording already has their name:")
+        for collision in sorted(collisions):
+            print(f"  {collision}")
+    
     if errors:
         print(f"\nErrors encountered:")
         for error in errors:
@@ -350,6 +2149,122 @@ def organize_music_files(input_dir, export_dir="export"):
     return len(processed) > 0
 
 
+def convert_into_export(input_dir, export_dir="export", jobs=None, link_mode='copy', excerpt=None, dedupe='bytes',
+                        batch_size=1, budget=None, cache=None, lookup_jobs=LOOKUP_CONCURRENCY, catalog=None):
+    """Convert audio files straight into the export layout
+    
+    Lookups only need file names, so tunes are resolved first and every
+    source is then converted (or placed, for MP3s) directly to
+    ``<rhythm>/<Title> (<Key>).mp3`` in the export directory, or to
+    ``unknown/`` when the tune can't be resolved. No intermediate mp3
+    directory is written. If several sources resolve to the same tune, the
+    first one in path order is used. Options are as for ``convert_to_mp3``
+    and ``organize_music_files``.
+    """
+    input_path = Path(input_dir)
+    if not input_path.exists():
+        print(_("cli.error.input_directory_not_exist", input_dir=input_dir))
+        return False
+    export_path = Path(export_dir)
+    
+    sources = sorted((audio_file for audio_file, ext in walk_audio_files(input_path, exclude=[export_path])),
+                     key=lambda f: f.relative_to(input_path).as_posix())
+    if not sources:
+        print(_("cli.error.no_audio_files", input_dir=input_dir))
+        print(_("cli.info.supported_formats", extensions=', '.join(AUDIO_EXTENSIONS)))
+        return False
+    
+    owns_cache = cache is None
+    if owns_cache:
+        cache = LookupCache()
+    owns_catalog = catalog is None
+    if owns_catalog:
+        catalog = open_catalog()
+    
+    # Files whose names normalise to the same query share one lookup
+    pending = {}
+    for source in sources:
+        query = clean_tune_query(source.stem)
+        key = normalize_tune_name(query, strip_types=False) or query
+        pending.setdefault(key, (query, []))[1].append(source)
+    lookups = list(pending.values())
+    print(f"Looking up {len(lookups)} tune names for {len(sources)} files...")
+    
+    resolved = {}
+    for attempt in range(REQUEUE_ROUNDS + 1):
+        if attempt:
+            print(f"Retrying {len(lookups)} lookups that failed temporarily...")
+        failed = []
+        for position, result, request_count in iter_resolved_tunes([query for query, members in lookups],
+                                                                   cache, lookup_jobs, catalog):
+            if result is None:
+                failed.append(lookups[position])
+                continue
+            for source in lookups[position][1]:
+                resolved[source] = result
+        lookups = failed
+        if not lookups:
+            break
+    
+    print(f"Lookups answered from cache: {cache.hits}")
+    print(f"Requests to thesession.org: {cache.requests}")
+    if catalog is not None:
+        print(f"Resolved from local catalog: {catalog.hits}")
+        if owns_catalog:
+            catalog.close()
+    if owns_cache:
+        cache.close()
+    
+    # A file whose lookup failed temporarily keeps its previous output, if
+    # any, rather than having it removed as an orphan
+    previous = load_manifest(export_path)['entries']
+    plan = {}
+    taken = set()
+    same_tune = []
+    unavailable = []
+    unknown_count = 0
+    for source in sources:
+        if source not in resolved:
+            entry = previous.get(source.relative_to(input_path).as_posix())
+            if entry and entry.get('output'):
+                taken.add(entry['output'].lower())
+                plan[source] = entry['output']
+            else:
+                unavailable.append(source)
+            continue
+        tune_url, (title, rhythm, key) = resolved[source]
+        if tune_url and all([title, rhythm, key]):
+            name = f"{sanitize_filename(rhythm)}/{sanitize_filename(title)} ({sanitize_filename(key)}).mp3"
+            if name.lower() in taken:
+                same_tune.append(source)
+                continue
+        else:
+            unknown_count += 1
+            name = f"unknown/{source.stem}.mp3"
+            number = 1
+            while name.lower() in taken:
+                number += 1
+                name = f"unknown/{source.stem} ({number}).mp3"
+        taken.add(name.lower())
+        plan[source] = name
+    
+    if unknown_count:
+        print(f"{unknown_count} files could not be matched and will go to unknown/")
+    if same_tune:
+        print(f"Skipping {len(same_tune)} files whose tune is already exported from another file:")
+        for source in same_tune:
+            print(f"  {source.name}")
+    if unavailable:
+        print(f"Skipping {len(unavailable)} files whose lookup failed temporarily (run again later):")
+        for source in unavailable:
+            print(f"  {source.name}")
+    if not plan:
+        return False
+    
+    print()
+    return convert_to_mp3(input_dir, export_dir, jobs, link_mode, excerpt, dedupe, batch_size, budget, output_plan=plan)
+
+
 def clean_filename(text: str) -> str:
     clean = re.sub(r'[^\w\s-]', '', text.lower())
     clean = re.sub(r'\s+', '_', clean)
@@ -392,36 +2307,147 @@ def format_key(key: str) -> str:
 def process_music_directory(music_dir: Path) -> List[dict]:
     cards = []
     
-    for rhythm_dir in music_dir.iterdir():
-        if not rhythm_dir.is_dir():
+    # Organized files live exactly one level down, in export/<rhythm>/;
+    # unknown/ holds unresolved files under their own names, which are not
+    # "Title (Key)" even when they look like it
+    for audio_file, ext in walk_audio_files(music_dir, ('.mp3',), max_depth=1):
+        if audio_file.parent == music_dir or audio_file.parent.name == 'unknown':
             continue
-            
-        rhythm = rhythm_dir.name
         
-        for audio_file in rhythm_dir.glob('*.mp3'):
-            tune_info = parse_filename(audio_file.name)
-            
-            if not tune_info:
-                print(f"Warning: Could not parse filename: {audio_file.name}")
-                continue
-            
-            title, key = tune_info[0]
-            formatted_key = format_key(key)
-            clean_name = clean_filename(f"{rhythm}_{title}")
-            
-            cards.append({
-                'original_file': audio_file,
-                'clean_filename': f"{clean_name}.mp3",
-                'rhythm': rhythm,
-                'title': title,
-                'key': formatted_key
-            })
+        rhythm = audio_file.parent.name
+        
+        tune_info = parse_filename(audio_file.name)
+        
+        if not tune_info:
+            print(f"Warning: Could not parse filename: {audio_file.name}")
+            continue
+        
+        title, key = tune_info[0]
+        formatted_key = format_key(key)
+        clean_name = clean_filename(f"{rhythm}_{title}")
+        
+        cards.append({
+            'original_file': audio_file,
+            'clean_filename': f"{clean_name}.mp3",
+            'rhythm': rhythm,
+            'title': title,
+            'key': formatted_key
+        })
 
     return cards
 
 
 
-def generate_apkg(music_dir, output_file="irish_music.apkg", deck_name="Irish Traditional Music", randomize_cards=True, card_layout=None):
+def stable_id(text, low=1000000000, high=9999999999):
+    """Derive a fixed ID in [low, high] from text, so a regenerated deck keeps its identity in Anki"""
+    digest = int(hashlib.sha256(text.encode('utf-8')).hexdigest()[:16], 16)
+    return low + digest % (high - low + 1)
+
+
+def note_guid(card):
+    """GUID of a tune's note, from its rhythm, title and key, so re-imports update it in place"""
+    return genanki.guid_for(card['rhythm'], card['title'], card['key'])
+
+
+BUILD_MANIFEST_VERSION = 1
+
+
+def build_manifest_path(output_file):
+    """Default location of the build manifest written next to an .apkg"""
+    output_path = Path(output_file)
+    return output_path.with_name(output_path.stem + '.manifest.json')
+
+
+def load_build_manifest(manifest_file):
+    """Load the manifest of an earlier build, or None if it can't be read"""
+    try:
+        with open(manifest_file, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == BUILD_MANIFEST_VERSION:
+            return manifest
+        print(f"Warning: Unsupported build manifest version in {manifest_file}")
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read build manifest {manifest_file}: {e}")
+    return None
+
+
+def save_build_manifest(manifest_file, manifest):
+    manifest_file = Path(manifest_file)
+    temp_file = manifest_file.with_name(manifest_file.name + '.tmp')
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(temp_file, manifest_file)
+
+
+def media_fingerprint(path, previous=None):
+    """Fingerprint a media file, reusing the previous hash if size and mtime are unchanged"""
+    stat = path.stat()
+    if previous and previous.get('size') == stat.st_size and previous.get('mtime') == stat.st_mtime_ns:
+        return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': previous['hash']}
+    return file_fingerprint(path)
+
+
+def _collection_bytes(db):
+    if hasattr(db, 'serialize'):  # Python 3.11+
+        return db.serialize()
+    # Older Pythons can only copy a database out through a file
+    fd, path = tempfile.mkstemp(suffix='.anki2')
+    os.close(fd)
+    try:
+        target = sqlite3.connect(path)
+        db.backup(target)
+        target.close()
+        return Path(path).read_bytes()
+    finally:
+        os.unlink(path)
+
+
+def write_apkg(package, output_file, timestamp=None):
+    """Write a genanki Package to an .apkg file
+    
+    Unlike ``Package.write_to_file``, the collection is built in an
+    in-memory SQLite database and written straight into the archive,
+    deflated since it compresses well, with no temporary file left
+    behind. Media are streamed from disk in chunks and stored as-is, as
+    MP3s gain nothing from deflating. The archive is written next to the
+    output and renamed into place once complete.
+    """
+    timestamp = time.time() if timestamp is None else timestamp
+    db = sqlite3.connect(':memory:')
+    try:
+        package.write_to_db(db.cursor(), timestamp, itertools.count(int(timestamp * 1000)))
+        db.commit()
+        collection = _collection_bytes(db)
+    finally:
+        db.close()
+    
+    output_path = Path(output_file)
+    temp_path = output_path.with_name(f".{output_path.name}.tmp")
+    try:
+        with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_STORED) as archive:
+            archive.writestr('collection.anki2', collection, compress_type=zipfile.ZIP_DEFLATED)
+            del collection
+            archive.writestr('media', json.dumps({str(index): os.path.basename(path)
+                                                  for index, path in enumerate(package.media_files)}))
+            for index, path in enumerate(package.media_files):
+                archive.write(path, str(index))
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if temp_path.exists():
+            temp_path.unlink()
+        raise
+
+
+def generate_apkg(music_dir, output_file="irish_music.apkg", deck_name="Irish Traditional Music", randomize_cards=True, card_layout=None,
+                  since=None, manifest_file=None):
+    """Build an .apkg from an organized music directory
+    
+    Every build writes a manifest of its notes and media (to
+    ``manifest_file``, default: next to the .apkg). Given the manifest of
+    an earlier build as ``since``, only notes that are new or whose
+    content or audio changed are packaged, with their media; notes keep
+    stable GUIDs, so importing the delta updates the existing deck.
+    """
     music_path = Path(music_dir)
     
     if not music_path.exists():
@@ -435,6 +2461,15 @@ def generate_apkg(music_dir, output_file="irish_music.apkg", deck_name="Irish Tr
             'back': {'name': True, 'audio': False, 'key': True, 'rhythm': True}
         }
     
+    previous_notes = {}
+    if since:
+        previous = load_build_manifest(since)
+        if previous is None:
+            return False
+        if previous.get('deck') != deck_name:
+            print(f"Warning: {since} was built for deck '{previous.get('deck')}', not '{deck_name}'")
+        previous_notes = previous['notes']
+    
     print(_("cli.info.processing_music_directory"))
     cards = process_music_directory(music_path)
     
@@ -516,10 +2551,12 @@ def generate_apkg(music_dir, output_file="irish_music.apkg", deck_name="Irish Tr
         ])
     
     deck = genanki.Deck(
-        random.randint(1000000000, 9999999999),  # Random deck ID
+        stable_id(deck_name),  # Same deck on every build with this name
         deck_name)
     
     media_files = []
+    notes = {}
+    unchanged = 0
     
     for card in cards:
         original_filename = card['original_file'].name
@@ -533,22 +2570,49 @@ def generate_apkg(music_dir, output_file="irish_music.apkg", deck_name="Irish Tr
             front_content = f"[sound:{original_filename}]"  # Fallback to audio
             back_content = f"<b>Title:</b> {card['title']}"  # Fallback to title
         
+        guid = note_guid(card)
+        previous = previous_notes.get(guid)
+        notes[guid] = {
+            'media': original_filename,
+            'fields': hashlib.sha256(f"{front_content}\x1f{back_content}".encode('utf-8')).hexdigest(),
+            **media_fingerprint(card['original_file'], previous),
+        }
+        if previous and all(previous.get(field) == notes[guid][field] for field in ('media', 'fields', 'hash')):
+            unchanged += 1
+            continue
+        
         note = genanki.Note(
             model=model,
-            fields=[front_content, back_content]
+            fields=[front_content, back_content],
+            guid=guid
         )
         
         deck.add_note(note)
         media_files.append(str(card['original_file']))
     
+    manifest_file = Path(manifest_file or build_manifest_path(output_file))
+    manifest = {'version': BUILD_MANIFEST_VERSION, 'deck': deck_name, 'notes': notes}
+    
+    if since:
+        removed = len(set(previous_notes) - set(notes))
+        print(f"Since {since}: {len(media_files)} new or changed notes, {unchanged} unchanged")
+        if removed:
+            print(f"  {removed} notes are no longer in {music_dir}; delete them in Anki if needed")
+        if not media_files:
+            print("Nothing to export, the deck is up to date")
+            save_build_manifest(manifest_file, manifest)
+            return True
+    
     output_path = Path(output_file)
     print(f"\nGenerating .apkg file: {output_path}")
     
     package = genanki.Package(deck)
     package.media_files = media_files
-    package.write_to_file(str(output_path))
+    write_apkg(package, output_path)
     
-    print(f"Generated {output_path} with {len(cards)} cards!")
+    save_build_manifest(manifest_file, manifest)
+    print(f"Generated {output_path} with {len(media_files)} cards!")
+    print(f"Build manifest: {manifest_file}")
     if randomize_cards:
         print("Cards have been randomized for varied study sessions!")
     print(f"Ready to import: Just double-click the .apkg file or import in Anki/AnkiDroid")
@@ -556,7 +2620,8 @@ def generate_apkg(music_dir, output_file="irish_music.apkg", deck_name="Irish Tr
     return True
 
 
-def generate_anki_cards(music_dir, output_file="irish_music.apkg", deck_name="Irish Traditional Music", randomize_cards=True, card_layout=None):
+def generate_anki_cards(music_dir, output_file="irish_music.apkg", deck_name="Irish Traditional Music", randomize_cards=True, card_layout=None,
+                        since=None, manifest_file=None):
     """Generate Anki cards as .apkg file"""
     if card_layout is None:
         # Default layout: Audio on front, Name + Key + Rhythm on back
@@ -564,7 +2629,77 @@ def generate_anki_cards(music_dir, output_file="irish_music.apkg", deck_name="Ir
             'front': {'name': False, 'audio': True, 'key': False, 'rhythm': False},
             'back': {'name': True, 'audio': False, 'key': True, 'rhythm': True}
         }
-    return generate_apkg(music_dir, output_file, deck_name, randomize_cards, card_layout)
+    return generate_apkg(music_dir, output_file, deck_name, randomize_cards, card_layout, since, manifest_file)
+
+
+def _seconds(value):
+    try:
+        return float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a number of seconds: {value}")
+
+
+def positive_seconds(value):
+    seconds = _seconds(value)
+    if not seconds > 0:
+        raise argparse.ArgumentTypeError(f"must be more than 0 seconds, got {value}")
+    return seconds
+
+
+def non_negative_seconds(value):
+    seconds = _seconds(value)
+    if not seconds >= 0:
+        raise argparse.ArgumentTypeError(f"can't be negative, got {value}")
+    return seconds
+
+
+def add_excerpt_arguments(parser):
+    parser.add_argument('--excerpt', type=positive_seconds, default=None, metavar='SECONDS', help='Cut a SECONDS-long study clip from each recording instead of converting it whole')
+    parser.add_argument('--excerpt-start', type=non_negative_seconds, default=DEFAULT_EXCERPT['start'], metavar='SECONDS', help=f"Offset of the clip into the recording (default: {DEFAULT_EXCERPT['start']:g})")
+    parser.add_argument('--excerpt-fade-in', type=non_negative_seconds, default=DEFAULT_EXCERPT['fade_in'], metavar='SECONDS', help=f"Fade-in length of the clip (default: {DEFAULT_EXCERPT['fade_in']:g})")
+    parser.add_argument('--excerpt-fade-out', type=non_negative_seconds, default=DEFAULT_EXCERPT['fade_out'], metavar='SECONDS', help=f"Fade-out length of the clip (default: {DEFAULT_EXCERPT['fade_out']:g})")
+
+
+def add_budget_arguments(parser):
+    parser.add_argument('--threads', type=int, default=None, help='Threads per ffmpeg process (default: ffmpeg decides)')
+    parser.add_argument('--nice', type=int, default=None, help='Run ffmpeg/ffprobe with this niceness (lower priority)')
+    parser.add_argument('--ionice', choices=['idle', 'best-effort'], default=None, help='IO scheduling class for ffmpeg/ffprobe (Linux only)')
+    parser.add_argument('--timeout', type=float, default=None, metavar='SECONDS', help='Kill any ffmpeg/ffprobe run taking longer than this per file')
+    parser.add_argument('--max-concurrency', type=int, default=None, help='Maximum number of ffmpeg/ffprobe processes running at once')
+
+
+def add_lookup_arguments(parser):
+    parser.add_argument('--refresh', action='store_true', help='Ignore cached thesession.org lookups and fetch them again')
+    parser.add_argument('--offline', action='store_true', help='Only use cached thesession.org lookups, never the network')
+    parser.add_argument('--cache-file', default=str(LOOKUP_CACHE_PATH), help=f'Lookup cache location (default: {LOOKUP_CACHE_PATH})')
+    parser.add_argument('--catalog', default=str(CATALOG_PATH), help=f'Offline tune catalog built by index-catalog, tried before thesession.org (default: {CATALOG_PATH})')
+    parser.add_argument('--match-threshold', type=float, default=MATCH_THRESHOLD, help=f'Minimum fuzzy match score (0-1) for a catalog name to be used (default: {MATCH_THRESHOLD})')
+    parser.add_argument('--backend', choices=RESOLVER_BACKENDS, default='json', help='thesession.org lookup backend; json falls back to html scraping (default: json)')
+    parser.add_argument('--rate', type=float, default=REQUEST_RATE, help=f'Average requests per second to thesession.org (default: {REQUEST_RATE})')
+    parser.add_argument('--burst', type=int, default=REQUEST_BURST, help=f'Requests allowed back to back before --rate applies (default: {REQUEST_BURST})')
+    parser.add_argument('--lookup-jobs', type=int, default=LOOKUP_CONCURRENCY, help=f'Lookups in flight at once (default: {LOOKUP_CONCURRENCY})')
+
+
+def cache_from_args(args):
+    limiter = TokenBucket(args.rate, args.burst)
+    session = create_http_session(pool_size=max(1, args.lookup_jobs))
+    return LookupCache(args.cache_file, refresh=args.refresh, offline=args.offline,
+                       resolver=create_resolver(args.backend, session, limiter), limiter=limiter)
+
+
+def catalog_from_args(args):
+    return open_catalog(args.catalog, args.match_threshold)
+
+
+def budget_from_args(args):
+    return ResourceBudget(args.threads, args.nice, args.ionice, args.timeout, args.max_concurrency)
+
+
+def excerpt_from_args(args):
+    if args.excerpt is None:
+        return None
+    return {'start': args.excerpt_start, 'duration': args.excerpt,
+            'fade_in': args.excerpt_fade_in, 'fade_out': args.excerpt_fade_out}
 
 
 def main():
@@ -574,41 +2709,85 @@ def main():
     convert_parser = subparsers.add_parser('convert', help='Convert audio files to mp3 format using ffmpeg')
     convert_parser.add_argument('input_dir', help='Directory containing audio files to convert')
     convert_parser.add_argument('--output', default='mp3_files', help='Output directory for mp3 files (default: mp3_files)')
+    convert_parser.add_argument('--jobs', type=int, default=None, help='Number of parallel ffmpeg conversions (default: CPU count)')
+    convert_parser.add_argument('--batch-size', type=int, default=1, help='Number of files converted per ffmpeg process, useful for many short files (default: 1)')
+    convert_parser.add_argument('--link-mode', choices=LINK_MODES, default='copy', help='How existing MP3s are placed in the output directory (default: copy)')
+    convert_parser.add_argument('--dedupe', choices=DEDUPE_MODES, default='bytes', help='Process identical recordings once: bytes compares file contents, audio also compares decoded audio (default: bytes)')
+    add_budget_arguments(convert_parser)
+    add_excerpt_arguments(convert_parser)
 
     organize_parser = subparsers.add_parser('organize', help='Organize music files using thesession.org metadata')
     organize_parser.add_argument('input_dir', help='Directory containing mp3 files to organize')
     organize_parser.add_argument('--output', default='export', help='Output directory (default: export)')
+    organize_parser.add_argument('--link-mode', choices=LINK_MODES, default='copy', help='How files are placed in the export directory (default: copy)')
+    organize_parser.add_argument('--dedupe', choices=DEDUPE_MODES, default='bytes', help='Process identical recordings once: bytes compares file contents, audio also compares decoded audio (default: bytes)')
+    organize_parser.add_argument('--resume', action='store_true', help='Continue an interrupted run, skipping files it already organized')
+    add_budget_arguments(organize_parser)
+    add_lookup_arguments(organize_parser)
     
     generate_parser = subparsers.add_parser('generate-cards', help='Generate Anki .apkg file from organized music files')
     generate_parser.add_argument('music_dir', help='Directory containing organized music files')
     generate_parser.add_argument('--output', default='irish_music.apkg', help='Output .apkg file (default: irish_music.apkg)')
     generate_parser.add_argument('--deck-name', default='Irish Traditional Music', help='Deck name (default: Irish Traditional Music)')
     generate_parser.add_argument('--no-randomize', action='store_true', help='Keep cards in original order instead of randomizing')
+    generate_parser.add_argument('--since', default=None, metavar='MANIFEST', help='Only package notes added or changed since the build that wrote MANIFEST')
+    generate_parser.add_argument('--manifest', default=None, help='Where to write this build\'s manifest (default: next to the .apkg, as <name>.manifest.json)')
     
     all_parser = subparsers.add_parser('all', help='Convert to mp3, organize files and generate Anki .apkg')
     all_parser.add_argument('input_dir', help='Directory containing audio files to process')
-    all_parser.add_argument('--mp3-dir', default='mp3_files', help='Intermediate directory for mp3 files (default: mp3_files)')
+    all_parser.add_argument('--via-mp3-dir', action='store_true', help='Convert everything into --mp3-dir first and organize from there, instead of converting straight into the export directory')
+    all_parser.add_argument('--mp3-dir', default=None, help='Intermediate directory for mp3 files with --via-mp3-dir (default: mp3_files)')
     all_parser.add_argument('--export-dir', default='export', help='Intermediate directory for organized files (default: export)')
     all_parser.add_argument('--output', default='irish_music.apkg', help='Output .apkg file (default: irish_music.apkg)')
     all_parser.add_argument('--deck-name', default='Irish Traditional Music', help='Deck name (default: Irish Traditional Music)')
     all_parser.add_argument('--no-randomize', action='store_true', help='Keep cards in original order instead of randomizing')
+    all_parser.add_argument('--jobs', type=int, default=None, help='Number of parallel ffmpeg conversions (default: CPU count)')
+    all_parser.add_argument('--batch-size', type=int, default=1, help='Number of files converted per ffmpeg process, useful for many short files (default: 1)')
+    all_parser.add_argument('--link-mode', choices=LINK_MODES, default='copy', help='How existing MP3s are placed in the export (or mp3) directory (default: copy)')
+    all_parser.add_argument('--organize-mode', choices=LINK_MODES, default=None, help='With --via-mp3-dir, how files go from the mp3 directory to the export directory; move saves a second copy but makes the next run convert everything again (default: copy)')
+    all_parser.add_argument('--dedupe', choices=DEDUPE_MODES, default='bytes', help='Process identical recordings once: bytes compares file contents, audio also compares decoded audio (default: bytes)')
+    all_parser.add_argument('--resume', action='store_true', help='With --via-mp3-dir, continue an interrupted organize step, skipping files it already organized')
+    add_budget_arguments(all_parser)
+    add_lookup_arguments(all_parser)
+    add_excerpt_arguments(all_parser)
+    
+    index_parser = subparsers.add_parser('index-catalog', help='Build the offline tune catalog from a thesession.org data dump')
+    index_parser.add_argument('dump', help='tunes.json or tunes.csv from the data dump, or the directory containing it')
+    index_parser.add_argument('--aliases', default=None, help='aliases.json or aliases.csv (default: next to the tunes file)')
+    index_parser.add_argument('--catalog', default=str(CATALOG_PATH), help=f'Catalog location (default: {CATALOG_PATH})')
     
     gui_parser = subparsers.add_parser('gui', help='Launch the graphical user interface')
     
     args = parser.parse_args()
     
+    if args.command == 'all' and not args.via_mp3_dir:
+        # These only exist in the two-step flow; don't let them look like they did something
+        ignored = [flag for flag, value in (('--mp3-dir', args.mp3_dir), ('--organize-mode', args.organize_mode),
+                                            ('--resume', args.resume)) if value]
+        if ignored:
+            all_parser.error(f"{', '.join(ignored)} can only be used with --via-mp3-dir")
+    
     if not args.command:
         parser.print_help()
         return
     
     if args.command == 'convert':
-        convert_to_mp3(args.input_dir, args.output)
+        budget = budget_from_args(args)
+        convert_to_mp3(args.input_dir, args.output, args.jobs, args.link_mode, excerpt_from_args(args), args.dedupe, args.batch_size, budget)
     
     elif args.command == 'organize':
-        organize_music_files(args.input_dir, args.output)
+        organize_music_files(args.input_dir, args.output, args.link_mode, args.dedupe, budget_from_args(args),
+                             cache_from_args(args), args.lookup_jobs, catalog_from_args(args), args.resume)
     
     elif args.command == 'generate-cards':
-        generate_anki_cards(args.music_dir, args.output, args.deck_name, not args.no_randomize)
+        generate_anki_cards(args.music_dir, args.output, args.deck_name, not args.no_randomize, None, args.since, args.manifest)
+    
+    elif args.command == 'index-catalog':
+        try:
+            tune_count, name_count = build_catalog(args.dump, args.catalog, args.aliases)
+            print(f"Indexed {tune_count} tunes under {name_count} names and aliases into {args.catalog}")
+        except (OSError, ValueError, KeyError, sqlite3.Error) as e:
+            print(f"Error: Could not build the tune catalog: {e}")
     
     elif args.command == 'gui':
         try:
@@ -618,11 +2797,26 @@ def main():
         except ImportError:
             print("Error: GUI dependencies not installed. Please run: pip install dearpygui")
     
+    elif args.command == 'all' and not args.via_mp3_dir:
+        budget = budget_from_args(args)
+        print("Step 1: Looking up tunes and converting them into the export directory...")
+        if convert_into_export(args.input_dir, args.export_dir, args.jobs, args.link_mode, excerpt_from_args(args),
+                               args.dedupe, args.batch_size, budget, cache_from_args(args), args.lookup_jobs,
+                               catalog_from_args(args)):
+            print(f"\nStep 2: Generating Anki .apkg file...")
+            generate_anki_cards(args.export_dir, args.output, args.deck_name, not args.no_randomize)
+        else:
+            print("Conversion failed, skipping Anki card generation")
+    
     elif args.command == 'all':
+        budget = budget_from_args(args)
+        args.mp3_dir = args.mp3_dir or 'mp3_files'
+        args.organize_mode = args.organize_mode or 'copy'
         print("Step 1: Converting audio files to mp3...")
-        if convert_to_mp3(args.input_dir, args.mp3_dir):
+        if convert_to_mp3(args.input_dir, args.mp3_dir, args.jobs, args.link_mode, excerpt_from_args(args), args.dedupe, args.batch_size, budget):
             print(f"\nStep 2: Organizing music files...")
-            if organize_music_files(args.mp3_dir, args.export_dir):
+            if organize_music_files(args.mp3_dir, args.export_dir, args.organize_mode, args.dedupe, budget,
+                                    cache_from_args(args), args.lookup_jobs, catalog_from_args(args), args.resume):
                 print(f"\nStep 3: Generating Anki .apkg file...")
                 generate_anki_cards(args.export_dir, args.output, args.deck_name, not args.no_randomize)
             else:
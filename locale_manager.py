@@ -141,7 +141,8 @@ class LocaleManager:
                     "current_directory": "Current Directory:",
                     "name": "Name",
                     "type": "Type", 
-                    "size": "Size"
+                    "size": "Size",
+                    "jobs": "Parallel Jobs:"
                 },
                 "section": {
                     "directories_files": "📁 Directories and Files",
@@ -158,7 +159,8 @@ class LocaleManager:
                     "name": "🏷️ Name",
                     "audio": "🎵 Audio", 
                     "key": "🎼 Key",
-                    "rhythm": "🎭 Rhythm"
+                    "rhythm": "🎭 Rhythm",
+                    "excerpt": "✂️ Cut Study Clips (seconds):"
                 },
                 "status": {
                     "ready": "Ready",